@@ -7,15 +7,43 @@
 
 
 import os
+import sys
+import glob
+import re
+import argparse
+import signal
 import fitz  # PyMuPDF
 from pdf2image import convert_from_path
-from PIL import Image
+from pdf2image.exceptions import PDFPopplerTimeoutError
+from PIL import Image, ImageFilter, TiffImagePlugin
 import pytesseract
 import logging
+try:
+    import tesserocr  # optional: keeps Tesseract loaded in-process instead of one tesseract.exe per call
+except ImportError:
+    tesserocr = None
+try:
+    import numpy as np  # optional: only needed for the image preprocessing stage
+except ImportError:
+    np = None
 from tkinter import Tk, Button, Label, IntVar
 from tkinter.filedialog import askopenfilename, askdirectory
 from tkinter import ttk
 import threading
+from contextlib import contextmanager
+import atexit
+import queue
+from collections import OrderedDict
+import sqlite3
+import hashlib
+import json
+import time
+import uuid
+import statistics
+import itertools
+from concurrent.futures import ThreadPoolExecutor, wait as wait_for_futures
+from multiprocessing import Pool, Queue as ProcessQueue, RawValue, cpu_count, current_process, freeze_support
+from multiprocessing.util import Finalize
 
 # Configure logging
 logging.basicConfig(
@@ -26,6 +54,109 @@ logging.basicConfig(
 
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+def user_cache_path(file_name):
+    # Per-user location shared by every run, wherever it is started from:
+    # %LOCALAPPDATA% on Windows, $XDG_CACHE_HOME or ~/.cache elsewhere.
+    if os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA') or os.path.join(os.path.expanduser('~'), 'AppData', 'Local')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'PDF-Conversion-Tool', file_name)
+
+# Settings that travel with every page task. Anything not passed explicitly
+# falls back to these values.
+DEFAULT_OPTIONS = {
+    'render_backend': 'pymupdf',  # 'pymupdf' renders in-process, 'poppler' uses convert_from_path
+    'output_dpi': 200,  # resolution of the saved page images
+    'render_colorspace': 'rgb',  # 'rgb' or 'gray', for the saved page images
+    'ocr_dpi_ladder': (150, 300),  # OCR renders, cheapest first; the next one is only tried when needed
+    'min_ocr_confidence': 60,  # mean Tesseract word confidence below which a match moves up the ladder
+    'ocr_engine': 'auto',  # 'tesserocr', 'pytesseract', or 'auto' to use tesserocr when it is installed
+    'ocr_lang': 'eng',
+    'number_hunt': True,  # try a fast digits-only OCR pass before full English OCR
+    'number_hunt_psm': 11,  # sparse text: find as much text as possible in no particular order
+    'number_hunt_oem': 1,  # LSTM engine only
+    'number_hunt_whitelist': '0123456789',
+    'preprocess_steps': (),  # any of PREPROCESS_STEPS, applied in that order to the OCR image only
+    'threshold_block_size': 31,  # adaptive threshold window in pixels at the OCR DPI
+    'threshold_offset': 10,  # how much darker than the local mean a pixel must be to count as ink
+    'max_skew_angle': 5.0,  # degrees either way searched by deskew
+    'tessdata_path': None,  # tessdata folder for tesserocr when it is not the compiled-in default
+    'roi_template': 'pod',  # name in ROI_TEMPLATES, a list of (name, box) pairs, or None for full page only
+    'ocr_cache_path': user_cache_path('ocr_cache.sqlite'),  # None disables the cache
+    'ocr_cache_max_bytes': 256 * 1024 * 1024,
+    'resume': True,  # skip pages already recorded in the output folder's checkpoint manifest
+    'output_format': 'png',  # key of OUTPUT_FORMATS
+    'output_bundle': None,  # None, 'tiff' or 'pdf' to combine each PDF's hits into one multi-page file
+    'group_format': 'tiff',  # 'tiff' or 'pdf' for the multi-page file of a number found on several pages
+    'split_pdf': False,  # write one PDF per number by copying the source pages instead of saving page images
+    'output_index': 'output_index.sqlite',  # number -> PDF/page index in the output folder; None disables it
+                                            # and leaves the per-page files ungrouped
+    'png_compress_level': 6,  # zlib level 0-9
+    'png_optimize': False,
+    'jpeg_quality': 85,
+    'writer_threads': 2,  # background encode/write threads per worker process
+    'writer_max_pending': 4,  # images queued for writing before a worker blocks
+    'metrics_file': 'pdf_metrics.jsonl',  # per-page JSON lines metrics in the output folder, None to disable
+    'ocr_timeout': 60,  # seconds per Tesseract call, 0 for no limit
+    'render_timeout': 60,  # seconds per poppler render; PyMuPDF renders are covered by page_timeout only
+    'page_timeout': 300,  # seconds before a pool worker stuck on one page is ended, 0 for no limit
+    'timeout_retry_scale': 0.5,  # DPI factor for the one retry of a page that timed out
+    'timeout_retry': False,  # set on that retry; a second timeout skips the page
+    'report_file': 'run_report.json',  # end-of-run report in the output folder (plus a .txt summary), None to disable
+}
+
+# Encodings for saved pages. 'mode' is the Pillow mode the cropped page is
+# reduced to before encoding; None keeps the rendered mode.
+OUTPUT_FORMATS = {
+    'png': {'extension': '.png', 'format': 'PNG', 'mode': None},
+    'png-gray': {'extension': '.png', 'format': 'PNG', 'mode': 'L'},
+    'png-1bit': {'extension': '.png', 'format': 'PNG', 'mode': '1'},
+    'tiff-g4': {'extension': '.tif', 'format': 'TIFF', 'mode': '1'},
+    'jpeg': {'extension': '.jpg', 'format': 'JPEG', 'mode': None},
+}
+
+# Gray level at or above which a pixel becomes white in 1-bit output.
+BILEVEL_THRESHOLD = 160
+
+# Cleanup applied before OCR, in this order. Deskew measures the skew on the
+# denoised page and thresholding goes last so rotation does not blur it again.
+PREPROCESS_STEPS = ('grayscale', 'denoise', 'deskew', 'threshold')
+DESKEW_SAMPLE_WIDTH = 800
+DESKEW_ANGLE_STEP = 0.25
+
+# Options that change what OCR sees or how it reads it. They are part of the
+# cache key so a cached result is never reused under different settings.
+OCR_CACHE_SETTINGS = ('render_backend', 'ocr_dpi_ladder', 'min_ocr_confidence', 'roi_template', 'ocr_lang',
+                      'number_hunt', 'number_hunt_psm', 'number_hunt_oem', 'number_hunt_whitelist',
+                      'preprocess_steps', 'threshold_block_size', 'threshold_offset', 'max_skew_angle')
+
+# Regions OCR'd before falling back to the full page, per document type.
+# Boxes are (left, top, right, bottom) as fractions of the page size and are
+# tried in order, so put the most likely region first.
+ROI_TEMPLATES = {
+    'pod': [
+        ('top_right', (0.45, 0.0, 1.0, 0.2)),
+        ('header', (0.0, 0.0, 1.0, 0.3)),
+    ],
+}
+
+# Named field sets for --fields. The first field names the output files;
+# where a pattern has a capturing group, the group is the field's value.
+FIELD_PRESETS = {
+    'pod': {
+        'pro': r'\d{10}',
+        'bol': r'(?i:\bB(?:OL|/L)\b)\s*(?:No\.?|#)?\s*:?\s*([A-Z0-9-]{5,})',
+        'date': r'\b(\d{1,2}[/.-]\d{1,2}[/.-](?:\d{4}|\d{2}))\b',
+    },
+}
+
+def resolve_options(options=None):
+    resolved = dict(DEFAULT_OPTIONS)
+    if options:
+        resolved.update(options)
+    return resolved
+
 def normalize_path(file_path):
     return os.path.abspath(os.path.normpath(file_path.strip()))
 
@@ -44,51 +175,2374 @@ def crop_image(image, crop_ratio=0.95):
     crop_box = (0, 0, int(img_width * crop_ratio), int(img_height * crop_ratio))
     return image.crop(crop_box)
 
+def crop_rect(page, crop_ratio=0.95):
+    # The same top-left part of the page as crop_image keeps, in the page
+    # coordinates get_pixmap clips to, so it does not depend on the DPI.
+    rect = page.rect
+    return fitz.Rect(rect.x0, rect.y0, rect.x0 + rect.width * crop_ratio, rect.y0 + rect.height * crop_ratio)
+
+def crop_page(page, crop_ratio=0.95):
+    # Applies crop_rect as the page's cropbox. The cropbox is given unrotated
+    # and relative to the mediabox, unlike page.rect.
+    rect = crop_rect(page, crop_ratio) * page.derotation_matrix
+    cropbox = page.cropbox
+    page.set_cropbox(fitz.Rect(cropbox.x0 + rect.x0, cropbox.y0 + rect.y0, cropbox.x0 + rect.x1, cropbox.y0 + rect.y1))
+
+class DocumentSession:
+    # Keeps one open fitz document per process and hands out pages by index.
+    # PyMuPDF is not thread-safe, so page access is serialized with a lock.
+    # When pickled into a worker process only the path travels; the child
+    # reopens the document on first use.
+    def __init__(self, pdf_path):
+        self.pdf_path = pdf_path
+        self._document = None
+        self._pid = None
+        self._lock = threading.RLock()
+
+    def _get_document(self):
+        if self._document is None or self._pid != os.getpid():
+            self._document = fitz.open(self.pdf_path)
+            self._pid = os.getpid()
+            logging.debug(f"Opened document session for {self.pdf_path} in process {self._pid}")
+        return self._document
+
+    def open(self):
+        with self._lock:
+            self._get_document()
+        return self
+
+    def __len__(self):
+        with self._lock:
+            return len(self._get_document())
+
+    @contextmanager
+    def page(self, page_number):
+        with self._lock:
+            yield self._get_document()[page_number]
+
+    @contextmanager
+    def document(self):
+        with self._lock:
+            yield self._get_document()
+
+    def close(self):
+        with self._lock:
+            if self._document is not None and self._pid == os.getpid():
+                self._document.close()
+            self._document = None
+            self._pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        return {'pdf_path': self.pdf_path}
+
+    def __setstate__(self, state):
+        self.__init__(state['pdf_path'])
+
+# Batch runs move every worker through many files, so only the most
+# recently used documents stay open in each process.
+MAX_OPEN_DOCUMENTS = 4
+
+_document_sessions = OrderedDict()
+_document_sessions_lock = threading.Lock()
+
+def get_document_session(pdf_path):
+    with _document_sessions_lock:
+        session = _document_sessions.get(pdf_path)
+        if session is None:
+            session = DocumentSession(pdf_path)
+            _document_sessions[pdf_path] = session
+            while len(_document_sessions) > MAX_OPEN_DOCUMENTS:
+                _, oldest_session = _document_sessions.popitem(last=False)
+                oldest_session.close()
+        else:
+            _document_sessions.move_to_end(pdf_path)
+        return session
+
+def close_document_session(pdf_path):
+    with _document_sessions_lock:
+        session = _document_sessions.pop(pdf_path, None)
+    if session is not None:
+        session.close()
+
+def close_document_sessions():
+    with _document_sessions_lock:
+        sessions = list(_document_sessions.values())
+        _document_sessions.clear()
+    for session in sessions:
+        session.close()
+
+atexit.register(close_document_sessions)
+
+class StageTimeout(Exception):
+    # A render or OCR call that ran past its limit and was stopped.
+    def __init__(self, stage, seconds):
+        super().__init__(stage, seconds)
+        self.stage = stage
+        self.seconds = seconds
+
+    def __str__(self):
+        return f"{self.stage} timed out after {self.seconds}s"
+
+# Lowest DPI a timed-out page is retried at.
+MIN_RETRY_DPI = 72
+
+def timeout_retry_options(options):
+    scale = options['timeout_retry_scale']
+    return dict(
+        options,
+        output_dpi=max(MIN_RETRY_DPI, int(options['output_dpi'] * scale)),
+        ocr_dpi_ladder=tuple(sorted({max(MIN_RETRY_DPI, int(dpi * scale)) for dpi in options['ocr_dpi_ladder']})),
+        timeout_retry=True,
+    )
+
+def render_page(session, page_number, dpi=200, colorspace='rgb', backend='pymupdf', timeout=None, crop_ratio=None):
+    # With a crop_ratio PyMuPDF only rasterizes the part of the page that is
+    # kept. Poppler renders the whole page, which is then cropped.
+    if colorspace not in ('rgb', 'gray'):
+        raise ValueError(f"Unsupported colorspace: {colorspace}")
+    if backend == 'poppler':
+        try:
+            images = convert_from_path(session.pdf_path, dpi=dpi, first_page=page_number + 1,
+                                       last_page=page_number + 1, grayscale=(colorspace == 'gray'), timeout=timeout)
+        except PDFPopplerTimeoutError:
+            raise StageTimeout('render', timeout)
+        return images[0] if crop_ratio is None else crop_image(images[0], crop_ratio=crop_ratio)
+    if backend != 'pymupdf':
+        raise ValueError(f"Unknown render backend: {backend}")
+
+    fitz_colorspace = fitz.csGRAY if colorspace == 'gray' else fitz.csRGB
+    with session.page(page_number) as page:
+        clip = None if crop_ratio is None else crop_rect(page, crop_ratio)
+        pixmap = page.get_pixmap(dpi=dpi, colorspace=fitz_colorspace, alpha=False, clip=clip)
+    mode = 'L' if colorspace == 'gray' else 'RGB'
+    return Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+
+class OcrCache:
+    # SQLite store of OCR results keyed by page content, evicted least
+    # recently used first once the stored rows exceed max_bytes. Like
+    # DocumentSession it reconnects after being moved into another process.
+    EVICT_EVERY = 64
+
+    def __init__(self, path, max_bytes=DEFAULT_OPTIONS['ocr_cache_max_bytes']):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._pid = None
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, number TEXT, ocr_text TEXT, roi TEXT, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_used ON ocr_cache (last_used)")
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT number, ocr_text, roi FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            connection.execute("UPDATE ocr_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            connection.commit()
+            self.hits += 1
+            return {'number': row[0], 'ocr_text': row[1], 'roi': row[2]}
+
+    def put(self, key, number, ocr_text, roi=None):
+        size = len(key) + len(number or '') + len(ocr_text or '') + len(roi or '')
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO ocr_cache (key, number, ocr_text, roi, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, number, ocr_text, roi, size, time.time())
+            )
+            connection.commit()
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict(connection)
+
+    def _evict(self, connection):
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute("SELECT key, size FROM ocr_cache ORDER BY last_used"):
+            evicted.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        connection.executemany("DELETE FROM ocr_cache WHERE key = ?", evicted)
+        connection.commit()
+        logging.info(f"OCR cache evicted {len(evicted)} entries from {self.path}")
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._evict(self._connection)
+                self._connection.close()
+            self._connection = None
+            self._pid = None
+
+    def __getstate__(self):
+        return {'path': self.path, 'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'], state['max_bytes'])
+
+_ocr_caches = {}
+_ocr_caches_lock = threading.Lock()
+
+def get_ocr_cache(path, max_bytes=DEFAULT_OPTIONS['ocr_cache_max_bytes']):
+    with _ocr_caches_lock:
+        cache = _ocr_caches.get(path)
+        if cache is None:
+            cache = OcrCache(path, max_bytes)
+            _ocr_caches[path] = cache
+        return cache
+
+def close_ocr_caches():
+    with _ocr_caches_lock:
+        caches = list(_ocr_caches.values())
+        _ocr_caches.clear()
+    for cache in caches:
+        cache.close()
+
+atexit.register(close_ocr_caches)
+
+def page_content_hash(session, page_number):
+    # Scanned pages usually share the same one-line content stream, so the
+    # raw image streams they draw are hashed as well.
+    with session.page(page_number) as page:
+        digest = hashlib.sha256(page.read_contents())
+        for image in page.get_images(full=True):
+            digest.update(page.parent.xref_stream_raw(image[0]) or b'')
+    return digest.hexdigest()
+
+def ocr_cache_key(content_hash, number_pattern, options):
+    settings = [content_hash, number_pattern, [options[name] for name in OCR_CACHE_SETTINGS]]
+    if not isinstance(number_pattern, str) and len(number_pattern) > 1:
+        # Entries written before fields were read from full-page text only
+        # hold the number-hunt text.
+        settings.append('field_text')
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()
+
+def crop_fraction(image, box):
+    img_width, img_height = image.size
+    left, top, right, bottom = box
+    return image.crop((int(img_width * left), int(img_height * top), int(img_width * right), int(img_height * bottom)))
+
+def get_roi_boxes(roi_template):
+    if not roi_template:
+        return []
+    if isinstance(roi_template, str):
+        if roi_template not in ROI_TEMPLATES:
+            raise ValueError(f"Unknown ROI template: {roi_template}")
+        return ROI_TEMPLATES[roi_template]
+    return list(roi_template)
+
+def adaptive_threshold(image, block_size=31, offset=10):
+    # Mean-of-neighbourhood threshold. Pillow's box blur computes the local
+    # mean in C in one uint8 image, so a page costs a few bytes per pixel
+    # whatever the window size. Pixels more than 'offset' darker than their
+    # local mean become black, everything else white.
+    local_mean = image.filter(ImageFilter.BoxBlur(block_size // 2))
+    paper = np.asarray(image, dtype=np.int16) + offset >= np.asarray(local_mean)
+    return Image.fromarray(paper).convert('L')
+
+def estimate_skew(image, max_angle=5.0, step=DESKEW_ANGLE_STEP):
+    # Projection profile search on a small copy of the page: text lines give
+    # the sharpest row-to-row changes in ink when they are level. A 1 degree
+    # sweep finds the neighbourhood and a finer one around it the angle.
+    scale = min(1.0, DESKEW_SAMPLE_WIDTH / image.width)
+    sample = image.resize((max(1, int(image.width * scale)), max(1, int(image.height * scale))), Image.BILINEAR)
+
+    def profile_score(angle):
+        rotated = sample.rotate(float(angle), resample=Image.BILINEAR, fillcolor=255)
+        profile = (255 - np.asarray(rotated, dtype=np.int32)).sum(axis=1)
+        return int(np.square(np.diff(profile)).sum())
+
+    coarse = max(np.arange(-max_angle, max_angle + 0.5, 1.0), key=profile_score)
+    fine = np.arange(coarse - 1.0 + step, coarse + 1.0, step)
+    return float(max(fine[np.abs(fine) <= max_angle], key=profile_score))
+
+def preprocess_image(image, steps, options, timer=None):
+    # Returns a new image for OCR; the caller's image is left as rendered so
+    # it can still be saved.
+    if np is None:
+        raise RuntimeError("Image preprocessing needs NumPy (pip install numpy)")
+    for step in steps:
+        if step not in PREPROCESS_STEPS:
+            raise ValueError(f"Unknown preprocessing step {step!r}; expected any of {', '.join(PREPROCESS_STEPS)}")
+    timer = timer or PageTimer()
+    with timer.stage('preprocess'):
+        if 'grayscale' in steps or image.mode != 'L':
+            image = image.convert('L')
+        if 'denoise' in steps:
+            image = image.filter(ImageFilter.MedianFilter(3))
+        if 'deskew' in steps:
+            angle = estimate_skew(image, options['max_skew_angle'])
+            if angle:
+                image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        if 'threshold' in steps:
+            image = adaptive_threshold(image, options['threshold_block_size'], options['threshold_offset'])
+    return image
+
+class OcrEngine:
+    # Process-wide OCR entry point. The tesserocr backend keeps one
+    # initialised Tesseract API per language for the life of the worker, so
+    # pages skip the tesseract.exe start-up, traineddata load and temp-file
+    # round trip that pytesseract pays on every call.
+    def __init__(self, backend='auto', tessdata_path=None):
+        if backend == 'auto':
+            backend = 'tesserocr' if tesserocr is not None else 'pytesseract'
+        if backend == 'tesserocr' and tesserocr is None:
+            raise ValueError("The tesserocr OCR engine was requested but tesserocr is not installed.")
+        if backend not in ('tesserocr', 'pytesseract'):
+            raise ValueError(f"Unknown OCR engine: {backend}")
+        self.backend = backend
+        self.tessdata_path = tessdata_path
+        self.calls = 0
+        self._apis = {}
+        self._lock = threading.Lock()
+
+    def _api(self, lang, oem):
+        # The engine mode is fixed when an API is initialised, so there is one
+        # API per language and engine mode.
+        api = self._apis.get((lang, oem))
+        if api is None:
+            init_args = {'lang': lang, 'oem': tesserocr.OEM.DEFAULT if oem is None else oem}
+            if self.tessdata_path:
+                init_args['path'] = self.tessdata_path
+            api = tesserocr.PyTessBaseAPI(**init_args)
+            self._apis[(lang, oem)] = api
+        return api
+
+    def image_to_string(self, image, lang='eng', psm=None, oem=None, whitelist=None, timeout=None):
+        return self.recognize(image, lang=lang, psm=psm, oem=oem, whitelist=whitelist, timeout=timeout)[0]
+
+    def recognize(self, image, want_confidence=False, lang='eng', psm=None, oem=None, whitelist=None, timeout=None):
+        # Returns (text, mean word confidence 0-100). The confidence is None
+        # unless asked for, since pytesseract needs the slower image_to_data.
+        # A call running past timeout seconds raises StageTimeout.
+        try:
+            return self._recognize(image, want_confidence, lang, psm, oem, whitelist, timeout)
+        except RuntimeError as e:
+            # pytesseract kills tesseract.exe and raises this on its timeout.
+            if timeout and 'timeout' in str(e).lower():
+                raise StageTimeout('ocr', timeout)
+            raise
+
+    def _recognize(self, image, want_confidence, lang, psm, oem, whitelist, timeout):
+        with self._lock:
+            self.calls += 1
+            if self.backend == 'pytesseract':
+                config = []
+                if psm is not None:
+                    config.append(f"--psm {psm}")
+                if oem is not None:
+                    config.append(f"--oem {oem}")
+                if whitelist:
+                    config.append(f"-c tessedit_char_whitelist={whitelist}")
+                if not want_confidence:
+                    return pytesseract.image_to_string(image, lang=lang, config=' '.join(config),
+                                                       timeout=timeout or 0), None
+                data = pytesseract.image_to_data(image, lang=lang, config=' '.join(config),
+                                                 output_type=pytesseract.Output.DICT, timeout=timeout or 0)
+                return text_and_confidence_from_data(data)
+            api = self._api(lang, oem)
+            api.SetPageSegMode(tesserocr.PSM.AUTO if psm is None else psm)
+            api.SetVariable('tessedit_char_whitelist', whitelist or '')
+            api.SetImage(image)
+            if timeout and not api.Recognize(int(timeout * 1000)):
+                raise StageTimeout('ocr', timeout)
+            text = api.GetUTF8Text()
+            return text, (api.MeanTextConf() if want_confidence else None)
+
+    def close(self):
+        with self._lock:
+            for api in self._apis.values():
+                api.End()
+            self._apis.clear()
+
+def text_and_confidence_from_data(data):
+    lines = {}
+    confidences = []
+    for index, word in enumerate(data['text']):
+        if not word.strip():
+            continue
+        line_key = (data['block_num'][index], data['par_num'][index], data['line_num'][index])
+        lines.setdefault(line_key, []).append(word)
+        confidence = float(data['conf'][index])
+        if confidence >= 0:
+            confidences.append(confidence)
+    text = '\n'.join(' '.join(words) for words in lines.values())
+    return text, (statistics.fmean(confidences) if confidences else 0.0)
+
+_ocr_engine = None
+_ocr_engine_lock = threading.Lock()
+
+def get_ocr_engine(options):
+    global _ocr_engine
+    with _ocr_engine_lock:
+        if _ocr_engine is None:
+            _ocr_engine = OcrEngine(options['ocr_engine'], options['tessdata_path'])
+            logging.debug(f"Using the {_ocr_engine.backend} OCR engine in {current_process().name}")
+        return _ocr_engine
+
+def close_ocr_engine():
+    global _ocr_engine
+    with _ocr_engine_lock:
+        engine, _ocr_engine = _ocr_engine, None
+    if engine is not None:
+        engine.close()
+
+atexit.register(close_ocr_engine)
+
+def ocr_find_number(image, number_pattern, roi_boxes=(), engine=None, want_confidence=False, **ocr_args):
+    # OCR the configured regions first and only fall back to the full page
+    # when none of them contains a match.
+    engine = engine or get_ocr_engine(DEFAULT_OPTIONS)
+    rois_tried = []
+    for roi_name, box in roi_boxes:
+        rois_tried.append(roi_name)
+        ocr_text, confidence = engine.recognize(crop_fraction(image, box), want_confidence, **ocr_args)
+        number_series = find_series_of_numbers(ocr_text, pattern=number_pattern)
+        if number_series:
+            return number_series, ocr_text, roi_name, rois_tried, confidence
+
+    rois_tried.append('full_page')
+    ocr_text, confidence = engine.recognize(image, want_confidence, **ocr_args)
+    number_series = find_series_of_numbers(ocr_text, pattern=number_pattern)
+    return number_series, ocr_text, 'full_page' if number_series else None, rois_tried, confidence
+
+def ocr_passes(options):
+    passes = []
+    if options['number_hunt']:
+        passes.append(('hunt', {'lang': options['ocr_lang'], 'psm': options['number_hunt_psm'],
+                                'oem': options['number_hunt_oem'], 'whitelist': options['number_hunt_whitelist'],
+                                'timeout': options['ocr_timeout'] or None}))
+    passes.append(('full', {'lang': options['ocr_lang'], 'timeout': options['ocr_timeout'] or None}))
+    return passes
+
+def ocr_confident(ocr, options):
+    return ocr['confidence'] is None or ocr['confidence'] >= options['min_ocr_confidence']
+
+def ocr_page(session, page_number, number_pattern, options, timer=None):
+    # Walks the OCR DPI ladder from the cheapest render up. At each DPI the
+    # number-hunt pass (digits only, sparse layout, LSTM only) runs first when
+    # enabled and full English OCR only if it finds nothing. A match below
+    # min_ocr_confidence moves on to the next DPI unless this is the last one.
+    # 'image' is the OCR render when it can double as the output image.
+    # 'ocr_text' is the text the other fields are read from: with more than
+    # one field a match from the number hunt or an ROI is followed by one
+    # full-page English pass, since digits-only text never holds a BOL or date.
+    timer = timer or PageTimer()
+    engine = get_ocr_engine(options)
+    roi_boxes = get_roi_boxes(options['roi_template'])
+    ladder = list(options['ocr_dpi_ladder'])
+    calls_before = engine.calls
+    rois_tried = []
+    best = None
+    best_ocr_image = None
+    ocr_text = ''
+
+    for rung, dpi in enumerate(ladder):
+        want_confidence = options['min_ocr_confidence'] > 0 and rung < len(ladder) - 1
+        with timer.stage('render'):
+            image = render_page(session, page_number, dpi=dpi, colorspace='gray', backend=options['render_backend'],
+                                timeout=options['render_timeout'] or None)
+        reusable = dpi == options['output_dpi'] and options['render_colorspace'] == 'gray'
+        ocr_image = image
+        if options['preprocess_steps']:
+            ocr_image = preprocess_image(image, options['preprocess_steps'], options, timer)
+
+        for pass_name, ocr_args in ocr_passes(options):
+            with timer.stage('ocr'):
+                number_series, ocr_text, roi_name, pass_rois, confidence = ocr_find_number(
+                    ocr_image, number_pattern, roi_boxes, engine, want_confidence, **ocr_args)
+            rois_tried.extend(f"{pass_name}/{name}" for name in pass_rois)
+            if not number_series:
+                continue
+            candidate = {'number': number_series, 'ocr_text': ocr_text, 'roi': f"{pass_name}/{roi_name}",
+                         'ocr_pass': pass_name, 'ocr_dpi': dpi, 'confidence': confidence,
+                         'image': image if reusable else None}
+            if best is None or confidence is None or confidence > best['confidence']:
+                best, best_ocr_image = candidate, ocr_image
+            break
+        if best is not None and ocr_confident(best, options):
+            break
+
+    if best is not None and best['roi'] != 'full/full_page' and len(get_pattern_set(number_pattern).names) > 1:
+        full_args = dict(ocr_passes(options))['full']
+        with timer.stage('ocr'):
+            best['ocr_text'] = engine.recognize(best_ocr_image, **full_args)[0]
+
+    timer.ocr_engine = engine.backend
+    timer.ocr_calls = engine.calls - calls_before
+    if best is None:
+        best = {'number': None, 'ocr_text': ocr_text, 'roi': None, 'ocr_pass': 'full', 'ocr_dpi': ladder[-1],
+                'confidence': None, 'image': None}
+    best['rois_tried'] = rois_tried
+    return best
+
+def record_roi_stats(roi_stats, result):
+    for roi_name in result.get('rois_tried', []):
+        stats = roi_stats.setdefault(roi_name, {'attempts': 0, 'hits': 0})
+        stats['attempts'] += 1
+        if roi_name == result.get('roi'):
+            stats['hits'] += 1
+
+def log_roi_stats(roi_stats):
+    for roi_name, stats in roi_stats.items():
+        hit_rate = 100.0 * stats['hits'] / stats['attempts'] if stats['attempts'] else 0.0
+        logging.info(f"ROI '{roi_name}': {stats['hits']}/{stats['attempts']} hits ({hit_rate:.1f}%)")
+
+class PatternSet:
+    # Named patterns compiled once into a single alternation, so one scan of
+    # the text finds every match of every field. Matches do not overlap: at
+    # any position the earliest listed pattern that matches wins. A plain
+    # string is a set with one field called 'number'. The first field is the
+    # one that names the output.
+    def __init__(self, patterns):
+        if isinstance(patterns, str):
+            patterns = {'number': patterns}
+        if not patterns:
+            raise ValueError("At least one pattern is required")
+        self.names = list(patterns)
+        self._groups = []
+        parts = []
+        group_index = 1
+        for name, pattern in patterns.items():
+            if not name.isidentifier():
+                raise ValueError(f"Pattern name must be an identifier: {name!r}")
+            inner_groups = re.compile(pattern).groups
+            self._groups.append((name, group_index, inner_groups))
+            parts.append(f"(?P<{name}>{pattern})")
+            group_index += 1 + inner_groups
+        self.regex = re.compile('|'.join(parts))
+
+    def _value(self, match):
+        for name, group_index, inner_groups in self._groups:
+            if match.group(group_index) is None:
+                continue
+            for inner in range(group_index + 1, group_index + 1 + inner_groups):
+                if match.group(inner) is not None:
+                    return name, match.group(inner)
+            return name, match.group(group_index)
+        return None, None
+
+    def find(self, text):
+        # Returns (first value of the naming field, {field: [values in order]}).
+        fields = {}
+        for match in self.regex.finditer(text):
+            name, value = self._value(match)
+            values = fields.setdefault(name, [])
+            if value not in values:
+                values.append(value)
+        key_values = fields.get(self.names[0])
+        return (key_values[0] if key_values else None), fields
+
+_pattern_sets = {}
+
+def get_pattern_set(patterns):
+    key = patterns if isinstance(patterns, str) else tuple(patterns.items())
+    pattern_set = _pattern_sets.get(key)
+    if pattern_set is None:
+        pattern_set = _pattern_sets[key] = PatternSet(patterns)
+    return pattern_set
+
+def find_fields(text, pattern=r'\d{10}'):
+    return get_pattern_set(pattern).find(text)
+
 def find_series_of_numbers(text, pattern=r'\d{10}'):
-    import re
-    match = re.search(pattern, text)
-    return match.group() if match else None
+    return find_fields(text, pattern)[0]
+
+# Pages whose images cover at least this share of the page are treated as
+# scans even when they carry some text.
+SCANNED_IMAGE_COVERAGE = 0.5
+
+def classify_page(page, number_pattern):
+    text = page.get_text()
+    number_series, fields = find_fields(text, pattern=number_pattern)
+
+    page_area = page.rect.get_area()
+    image_area = 0.0
+    for image_info in page.get_image_info():
+        image_area += (fitz.Rect(image_info['bbox']) & page.rect).get_area()
+    image_coverage = min(1.0, image_area / page_area) if page_area else 0.0
+
+    if number_series:
+        page_class = 'digital'
+    elif image_coverage >= SCANNED_IMAGE_COVERAGE or not text.strip():
+        page_class = 'scanned'
+    else:
+        page_class = 'mixed'
+    return {'class': page_class, 'number': number_series, 'fields': fields, 'image_coverage': round(image_coverage, 3)}
+
+def classify_pdf(pdf_path, number_pattern, skip_pages=()):
+    # One pass over the text layer and image placements of every page, so
+    # only pages that really need OCR are sent to the pool.
+    session = get_document_session(pdf_path)
+    page_infos = {}
+    for page_number in range(len(session)):
+        if page_number in skip_pages:
+            continue
+        with session.page(page_number) as page:
+            page_infos[page_number] = classify_page(page, number_pattern)
+    return page_infos
+
+def page_result(page_number, status, message, number=None, output_path=None, **fields):
+    result = {
+        'page': page_number,
+        'status': status,  # 'saved', 'no_match' or 'error'
+        'number': number,
+        'output_path': output_path,
+        'message': message,
+    }
+    result.update(fields)
+    return result
+
+class ImageWriter:
+    # Encodes and writes output images on background threads so workers can
+    # move on to the next page. submit() blocks once max_pending images are
+    # queued, which keeps memory bounded when the disk falls behind.
+    def __init__(self, threads=2, max_pending=4):
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='image-writer')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self.stats = new_writer_stats()
+
+    def submit(self, image, output_path, output_format, save_args, page=None):
+        # page ({'pdf', 'page', 'source'}) identifies the source page in the
+        # stats when the write fails.
+        started = time.perf_counter()
+        self._slots.acquire()
+        waited = time.perf_counter() - started
+        future = self._executor.submit(self._write, image, output_path, output_format, save_args, page)
+        with self._lock:
+            self.stats['wait_seconds'] += waited
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return waited
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def _write(self, image, output_path, output_format, save_args, page=None):
+        started = time.perf_counter()
+        partial_path = temporary_path(output_path)
+        try:
+            convert_for_output(image, OUTPUT_FORMATS[output_format]['mode']).save(partial_path, **save_args)
+            os.replace(partial_path, output_path)
+            written = os.path.getsize(output_path)
+        except Exception as e:
+            logging.error(f"Error writing {output_path}: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            with self._lock:
+                self.stats['errors'] += 1
+                self.stats['failed'].append(dict(page or {}, output_path=output_path, error_type=type(e).__name__,
+                                                 message=str(e)))
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            merge_writer_stats(self.stats, {
+                'images': 1, 'bytes': written, 'write_seconds': elapsed,
+                'formats': {output_format: {'images': 1, 'bytes': written, 'write_seconds': elapsed}},
+            })
+
+    def flush(self):
+        with self._lock:
+            pending = list(self._pending)
+        wait_for_futures(pending)
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        return self.stats
+
+def new_writer_stats():
+    return {'images': 0, 'bytes': 0, 'errors': 0, 'write_seconds': 0.0, 'wait_seconds': 0.0, 'formats': {},
+            'failed': []}
+
+def merge_writer_stats(total, stats):
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            merge_writer_stats(total.setdefault(name, {}), value)
+        elif isinstance(value, list):
+            total.setdefault(name, []).extend(value)
+        else:
+            total[name] = total.get(name, 0) + value
+    return total
+
+def log_writer_stats(writer_stats):
+    logging.info(f"Writer stage: {writer_stats['images']} images, {writer_stats['bytes'] / 1048576:.1f} MB, "
+                 f"{writer_stats['write_seconds']:.2f}s encoding and writing, "
+                 f"{writer_stats['wait_seconds']:.2f}s workers waited for a free slot, "
+                 f"{writer_stats['errors']} write errors")
+    for output_format, stats in writer_stats['formats'].items():
+        average = stats['bytes'] / stats['images'] / 1024 if stats['images'] else 0.0
+        logging.info(f"Output format {output_format}: {stats['images']} images, {stats['bytes']} bytes "
+                     f"({average:.1f} KB each), {stats['write_seconds']:.2f}s")
+
+def write_failure_results(writer_stats):
+    # Pages reported as saved whose image could not be written. The worker
+    # has already returned them by the time the write fails, so the caller
+    # records these later results over the saved ones.
+    for failure in writer_stats['failed']:
+        result = page_result(failure['page'], 'error',
+                             f"Page {failure['page'] + 1}: Writing {failure['output_path']} failed: {failure['message']}",
+                             error_type=failure['error_type'], source=failure['source'], write_failed=True)
+        result['pdf'] = failure['pdf']
+        yield result
+
+_image_writer = None
+_image_writer_lock = threading.Lock()
+
+def get_image_writer(options):
+    global _image_writer
+    with _image_writer_lock:
+        if _image_writer is None:
+            _image_writer = ImageWriter(options['writer_threads'], options['writer_max_pending'])
+        return _image_writer
+
+def close_image_writer():
+    # Waits for queued writes and returns the writer's stats.
+    global _image_writer
+    with _image_writer_lock:
+        writer, _image_writer = _image_writer, None
+    return writer.close() if writer is not None else new_writer_stats()
+
+def convert_for_output(image, mode):
+    if mode is None or image.mode == mode:
+        return image
+    gray_image = image if image.mode == 'L' else image.convert('L')
+    if mode == 'L':
+        return gray_image
+    # A plain threshold keeps scanned text crisp where Pillow's default
+    # dithering would speckle the background.
+    return gray_image.point(lambda value: 255 if value >= BILEVEL_THRESHOLD else 0, mode='1')
+
+def output_save_args(options):
+    output_format = OUTPUT_FORMATS[options['output_format']]
+    if output_format['format'] == 'PNG':
+        return {'format': 'PNG', 'compress_level': options['png_compress_level'], 'optimize': options['png_optimize']}
+    if output_format['format'] == 'TIFF':
+        return {'format': 'TIFF', 'compression': 'group4'}
+    return {'format': 'JPEG', 'quality': options['jpeg_quality']}
+
+def output_path_for(output_folder, number_series, options, pdf_path=None, page_number=None):
+    # With a source page the name is unique to that page, so workers never
+    # overwrite each other when a number shows up more than once. Those
+    # part files are renamed or grouped per number once the run is done.
+    extension = OUTPUT_FORMATS[options['output_format']]['extension']
+    if pdf_path is None:
+        return os.path.join(output_folder, f"{safe_file_name(number_series)}{extension}")
+    return os.path.join(output_folder, f"{part_stem(number_series, pdf_path, page_number)}{extension}")
+
+def pdf_stem(pdf_path):
+    # File name stem plus a short hash of the full path, so PDFs with the
+    # same name in different folders never share output or checkpoint names.
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    path_hash = hashlib.sha1(os.path.normcase(normalize_path(pdf_path)).encode('utf-8')).hexdigest()[:8]
+    return f"{stem}-{path_hash}"
+
+def safe_file_name(number_series):
+    # Numbers come from OCR or user-supplied field patterns (a date such as
+    # 03/14/2025), so anything but word characters, dots and dashes is
+    # replaced and a leading dot can never make a hidden file or "..".
+    name = re.sub(r'[^\w.-]', '_', number_series)
+    return re.sub(r'^\.', '_', name) or '_'
+
+def part_stem(number_series, pdf_path, page_number):
+    return f"{safe_file_name(number_series)}_{pdf_stem(pdf_path)}_p{page_number + 1:04d}"
+
+def is_part_path(output_path, number_series, pdf_path, page_number):
+    return os.path.splitext(os.path.basename(output_path))[0] == part_stem(number_series, pdf_path, page_number)
+
+def is_number_output(output_path, number_series):
+    # NUMBER.ext or NUMBER_2.ext, ... as named by group_outputs_by_number.
+    stem = os.path.splitext(os.path.basename(output_path))[0]
+    return re.fullmatch(re.escape(safe_file_name(number_series)) + r'(_\d+)?', stem) is not None
+
+def temporary_path(path):
+    # Output is written next to its final path and moved into place, so an
+    # interrupted write never leaves a truncated file under the real name.
+    return f"{path}.tmp"
+
+def split_pdf_path(output_folder, number_series):
+    return os.path.join(output_folder, f"{safe_file_name(number_series)}.pdf")
+
+def saved_message(page_number, output_path, options, note=None):
+    action = "Split into" if options['split_pdf'] else "Image saved as"
+    return f"Page {page_number + 1}: {action} {output_path}" + (f" ({note})" if note else "")
+
+def save_page_output(session, page_number, output_folder, number_series, crop_ratio, options, timer, image=None,
+                     source=None):
+    # In split-PDF mode nothing is rendered: the source page is copied into
+    # the number's PDF once the run is done, so only its path is returned.
+    if options['split_pdf']:
+        return split_pdf_path(output_folder, number_series)
+    if image is None:
+        # Rendered already cropped, so the discarded margin is never rasterized.
+        image = render_for_options(session, page_number, options, timer, crop_ratio)
+        crop_ratio = None
+    return save_page_image(image, output_folder, number_series, crop_ratio, options, timer, session.pdf_path,
+                           page_number, source)
+
+def save_page_image(image, output_folder, number_series, crop_ratio, options, timer=None, pdf_path=None,
+                    page_number=None, source=None):
+    # A crop_ratio of None means the image was rendered already cropped.
+    timer = timer or PageTimer()
+    output_path = output_path_for(output_folder, number_series, options, pdf_path, page_number)
+    if crop_ratio is not None:
+        with timer.stage('crop'):
+            image = crop_image(image, crop_ratio=crop_ratio)
+    with timer.stage('save'):
+        get_image_writer(options).submit(image, output_path, options['output_format'], output_save_args(options),
+                                         {'pdf': pdf_path, 'page': page_number, 'source': source})
+    return output_path
+
+def bundle_output_images(image_paths, bundle_path, bundle_format):
+    # Combines saved page images into one multi-page file, one page at a
+    # time so large runs never hold every image in memory. An entry can also
+    # be (path, page) to take one page of an earlier multi-page output.
+    started = time.perf_counter()
+    image_pages = [item if isinstance(item, tuple) else (item, 0) for item in image_paths]
+    if bundle_format == 'pdf':
+        bundle = fitz.open()
+        for image_path, page_number in image_pages:
+            with fitz.open(image_path) as image_document:
+                if image_document.is_pdf:
+                    bundle.insert_pdf(image_document, from_page=page_number, to_page=page_number)
+                    continue
+                with fitz.open('pdf', image_document.convert_to_pdf(page_number, page_number)) as image_pdf:
+                    bundle.insert_pdf(image_pdf)
+        bundle.save(bundle_path, garbage=3, deflate=True)
+        bundle.close()
+    elif bundle_format == 'tiff':
+        with TiffImagePlugin.AppendingTiffWriter(bundle_path, True) as bundle:
+            for image_path, page_number in image_pages:
+                with Image.open(image_path) as image:
+                    image.seek(page_number)
+                    compression = 'group4' if image.mode == '1' else 'tiff_deflate'
+                    image.save(bundle, format='TIFF', compression=compression)
+                bundle.newFrame()
+    else:
+        raise ValueError(f"Unknown output bundle: {bundle_format}")
+    return {'pages': len(image_paths), 'bytes': os.path.getsize(bundle_path), 'seconds': time.perf_counter() - started}
+
+class PageTimer:
+    # Collects how long each stage of one page took. 'save' only covers
+    # handing the image to the writer; the encode itself is timed there.
+    def __init__(self):
+        self.timings = {}
+        self.image_size = None
+        self.ocr_engine = None
+        self.ocr_calls = 0
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+def render_for_options(session, page_number, options, timer=None, crop_ratio=None):
+    timer = timer or PageTimer()
+    with timer.stage('render'):
+        image = render_page(session, page_number, dpi=options['output_dpi'], colorspace=options['render_colorspace'],
+                            backend=options['render_backend'], timeout=options['render_timeout'] or None,
+                            crop_ratio=crop_ratio)
+    timer.image_size = image.size
+    return image
+
+def cached_page_result(session, page_number, output_folder, crop_ratio, options, cached, timer, number_pattern):
+    number_series = cached['number']
+    fields = find_fields(cached['ocr_text'] or '', pattern=number_pattern)[1]
+    if not number_series:
+        return page_result(page_number, 'no_match', f"Page {page_number + 1}: No series found (cached OCR result).",
+                           cache='hit', fields=fields)
+
+    # Only render again when the earlier run did not get as far as saving.
+    output_path = output_path_for(output_folder, number_series, options, session.pdf_path, page_number)
+    if options['split_pdf'] or not os.path.exists(output_path):
+        output_path = save_page_output(session, page_number, output_folder, number_series, crop_ratio, options, timer,
+                                       source='cache')
+    return page_result(page_number, 'saved', saved_message(page_number, output_path, options, "cached OCR result"),
+                       number=number_series, output_path=output_path, roi=cached['roi'], cache='hit', source='cache',
+                       fields=fields)
 
 def process_page(args):
-    page_number, pdf_path, output_folder, number_pattern, crop_ratio = args
+    page_number, pdf_path, output_folder, number_pattern, crop_ratio = args[:5]
+    options = resolve_options(args[5] if len(args) > 5 else None)
+    page_info = args[6] if len(args) > 6 else None
+    timer = PageTimer()
+    if _page_watchdog is not None:
+        _page_watchdog.watch((pdf_path, page_number), options['page_timeout'])
+    try:
+        result = find_and_save_page(page_number, pdf_path, output_folder, number_pattern, crop_ratio, options,
+                                    page_info, timer)
+    finally:
+        if _page_watchdog is not None:
+            _page_watchdog.clear()
+    result['pdf'] = pdf_path
+    result['timings'] = {name: round(seconds, 6) for name, seconds in timer.timings.items()}
+    result['worker'] = current_process().name
+    result['dpi'] = options['output_dpi']
+    result['image_size'] = timer.image_size
+    if timer.ocr_calls:
+        result['ocr_engine'] = timer.ocr_engine
+        result['ocr_calls'] = timer.ocr_calls
+    return result
+
+def find_and_save_page(page_number, pdf_path, output_folder, number_pattern, crop_ratio, options, page_info=None,
+                       timer=None):
+    timer = timer or PageTimer()
     try:
-        pdf_document = fitz.open(pdf_path)
-        page = pdf_document[page_number]
-
-        text = page.get_text()
-        number_series = find_series_of_numbers(text, pattern=number_pattern)
-
-        if not number_series:
-            images = convert_from_path(pdf_path, first_page=page_number + 1, last_page=page_number + 1)
-            for image in images:
-                ocr_text = pytesseract.image_to_string(image, lang='eng')
-                number_series = find_series_of_numbers(ocr_text, pattern=number_pattern)
-
-                if number_series:
-                    cropped_image = crop_image(image, crop_ratio=crop_ratio)
-                    output_path = os.path.join(output_folder, f"{number_series}.png")
-                    cropped_image.save(output_path, "PNG")
-                    pdf_document.close()
-                    return f"Page {page_number + 1}: Image saved as {output_path}"
-
-        pdf_document.close()
-        return f"Page {page_number + 1}: No series found, text extraction performed."
+        with timer.stage('open'):
+            session = get_document_session(pdf_path).open()
+        if page_info is not None:
+            number_series, fields = page_info['number'], page_info['fields']
+        else:
+            with timer.stage('text'):
+                with session.page(page_number) as page:
+                    text = page.get_text()
+                number_series, fields = find_fields(text, pattern=number_pattern)
+
+        # Text-layer hits only need the render and save, never Tesseract.
+        if number_series:
+            output_path = save_page_output(session, page_number, output_folder, number_series, crop_ratio, options,
+                                           timer, source='text')
+            return page_result(page_number, 'saved', saved_message(page_number, output_path, options, "text layer"),
+                               number=number_series, output_path=output_path, source='text', fields=fields)
+
+        cache = None
+        if options['ocr_cache_path']:
+            with timer.stage('cache'):
+                cache = get_ocr_cache(options['ocr_cache_path'], options['ocr_cache_max_bytes'])
+                cache_key = ocr_cache_key(page_content_hash(session, page_number), number_pattern, options)
+                cached = cache.get(cache_key)
+            if cached is not None:
+                return cached_page_result(session, page_number, output_folder, crop_ratio, options, cached, timer,
+                                          number_pattern)
+
+        ocr = ocr_page(session, page_number, number_pattern, options, timer)
+        number_series = ocr['number']
+        if cache is not None:
+            with timer.stage('cache'):
+                cache.put(cache_key, number_series, ocr['ocr_text'], ocr['roi'])
+        cache_status = 'miss' if cache is not None else None
+
+        # Other fields come from the full-page text ocr_page returns with
+        # the number, which is also what the cache keeps.
+        ocr_fields = {'rois_tried': ocr['rois_tried'], 'cache': cache_status, 'ocr_pass': ocr['ocr_pass'],
+                      'ocr_dpi': ocr['ocr_dpi'], 'ocr_confidence': ocr['confidence'],
+                      'fields': find_fields(ocr['ocr_text'] or '', pattern=number_pattern)[1]}
+        if number_series:
+            output_path = save_page_output(session, page_number, output_folder, number_series, crop_ratio, options,
+                                           timer, ocr['image'], source='ocr')
+            return page_result(page_number, 'saved', saved_message(page_number, output_path, options),
+                               number=number_series, output_path=output_path, roi=ocr['roi'], source='ocr',
+                               **ocr_fields)
+
+        return page_result(page_number, 'no_match', f"Page {page_number + 1}: No series found, text extraction performed.",
+                           **ocr_fields)
+    except StageTimeout as e:
+        logging.warning(f"Page {page_number + 1} of {pdf_path}: {e}")
+        if options['timeout_retry']:
+            return page_result(page_number, 'skipped', f"Page {page_number + 1}: Skipped, {e} again at lower DPI",
+                               timed_out=e.stage)
+        retry_options = timeout_retry_options(options)
+        result = find_and_save_page(page_number, pdf_path, output_folder, number_pattern, crop_ratio, retry_options,
+                                    page_info, timer)
+        result['timeout_retry'] = {'stage': e.stage, 'dpi': retry_options['output_dpi']}
+        return result
     except Exception as e:
         logging.error(f"Error processing page {page_number + 1}: {e}")
-        return f"Error processing page {page_number + 1}: {e}"
+        return page_result(page_number, 'error', f"Error processing page {page_number + 1}: {e}",
+                           error_type=type(e).__name__)
+
+# Longest the parent waits for a finished chunk before checking for hung
+# pages, and how often workers check for a drain request.
+WATCHDOG_POLL_SECONDS = 0.5
+
+class PageWatchdog:
+    # Runs in each pool worker. A page still running after page_timeout is
+    # usually stuck in native code (a PyMuPDF render, a corrupt stream) that
+    # no in-process timeout can interrupt. The watchdog then flushes the
+    # image writer, tells the parent which page hung and ends the worker;
+    # the pool starts a replacement and the parent queues the page again.
+    # Once a worker has been ended the pool cannot shut down normally, so the
+    # parent raises drain_flag instead and the remaining workers flush their
+    # writers before being terminated. The flag is a lock-free shared value
+    # polled by each worker: a multiprocessing Event can deadlock when one of
+    # its waiters is the worker that was just ended.
+    def __init__(self, events_queue, drain_flag):
+        self._events = events_queue
+        self._condition = threading.Condition()
+        self._page_key = None
+        self._deadline = None
+        threading.Thread(target=self._run, name='page-watchdog', daemon=True).start()
+        threading.Thread(target=self._drain, args=(drain_flag,), name='writer-drain', daemon=True).start()
+
+    @staticmethod
+    def _drain(drain_flag):
+        while not drain_flag.value:
+            time.sleep(WATCHDOG_POLL_SECONDS)
+        _shutdown_worker_writer()
+
+    def watch(self, page_key, timeout):
+        with self._condition:
+            self._page_key = page_key
+            self._deadline = time.monotonic() + timeout if timeout else None
+            self._condition.notify()
+
+    def clear(self):
+        with self._condition:
+            self._page_key = self._deadline = None
+
+    def _run(self):
+        with self._condition:
+            while True:
+                if self._deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    page_key = self._page_key
+                    break
+                self._condition.wait(remaining)
+        pdf_path, page_number = page_key
+        logging.error(f"Page {page_number + 1} of {pdf_path} hung; ending worker {current_process().name}")
+        _shutdown_worker_writer()
+        self._events.put(('timeout', page_key))
+        # Queue puts go through a feeder thread, so flush them before exiting.
+        for process_queue in (self._events, _worker_stats_queue):
+            if process_queue is not None:
+                process_queue.close()
+                process_queue.join_thread()
+        os._exit(1)
+
+_worker_stats_queue = None
+_page_watchdog = None
+
+def _init_worker(stats_queue=None, events_queue=None, drain_flag=None):
+    # Pool workers exit through multiprocessing's own shutdown, which skips
+    # atexit handlers, so register the cleanup as finalizers instead. The
+    # image writer is drained first and its stats are sent back to the parent.
+    # Ctrl+C is left to the parent, which cancels the job cleanly.
+    global _worker_stats_queue, _page_watchdog
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_stats_queue = stats_queue
+    if events_queue is not None:
+        _page_watchdog = PageWatchdog(events_queue, drain_flag)
+    Finalize(None, _shutdown_worker_writer, exitpriority=20)
+    Finalize(None, close_document_sessions, exitpriority=10)
+    Finalize(None, close_ocr_caches, exitpriority=10)
+    Finalize(None, close_ocr_engine, exitpriority=10)
+
+def _shutdown_worker_writer():
+    stats = close_image_writer()
+    if _worker_stats_queue is not None:
+        _worker_stats_queue.put(stats)
+
+def process_page_chunk(tasks):
+    return [process_page(task) for task in tasks]
+
+def iter_task_chunks(tasks, chunksize):
+    tasks = iter(tasks)
+    while True:
+        chunk = list(itertools.islice(tasks, chunksize))
+        if not chunk:
+            return
+        yield chunk
+
+def run_page_tasks(tasks, workers=None, chunksize=1, execution_mode='process', writer_stats=None, max_pending=None,
+                   cancel=None):
+    # Yields page results in completion order. Tasks can be any iterable and
+    # are only pulled from it as results come back: at most max_pending
+    # chunks (two per worker by default) are queued, running or waiting to be
+    # consumed, so neither tasks nor results pile up in the parent however
+    # long the input is. Pool.imap_unordered would read the whole iterable up
+    # front. Once every task is done the image writers are drained and their
+    # stats are merged into writer_stats. Setting the cancel event (a
+    # threading.Event) stops new pages from being queued; pages already in
+    # flight still finish, so their output and checkpoints stay consistent.
+    # Only execution_mode='sequential' runs pages in this process, where no
+    # watchdog can end a hung page; a single worker still gets a pool.
+    if writer_stats is None:
+        writer_stats = new_writer_stats()
+    if execution_mode == 'sequential':
+        try:
+            for task in tasks:
+                if cancel is not None and cancel.is_set():
+                    break
+                yield process_page(task)
+        finally:
+            merge_writer_stats(writer_stats, close_image_writer())
+        return
+    if execution_mode != 'process':
+        raise ValueError(f"Unknown execution mode: {execution_mode}")
+
+    pool_workers = workers or cpu_count()
+    max_pending = max_pending or 2 * pool_workers
+    chunks = iter_task_chunks(tasks, chunksize)
+    finished_chunks = queue.Queue()
+    stats_queue = ProcessQueue()
+    events_queue = ProcessQueue()
+    drain_flag = RawValue('b', 0)
+    pool = Pool(processes=pool_workers, initializer=_init_worker, initargs=(stats_queue, events_queue, drain_flag))
+    in_flight = {}
+    chunk_ids = itertools.count()
+    workers_ended = 0
+
+    def submit_chunk(chunk):
+        chunk_id = next(chunk_ids)
+        in_flight[chunk_id] = chunk
+        pool.apply_async(process_page_chunk, (chunk,), callback=lambda results: finished_chunks.put((chunk_id, results)),
+                         error_callback=lambda error: finished_chunks.put((chunk_id, error)))
+
+    def submit(count):
+        if cancel is not None and cancel.is_set():
+            return
+        for chunk in itertools.islice(chunks, count):
+            submit_chunk(chunk)
+
+    def handle_hung_pages():
+        # A worker ended by its watchdog never returns its chunk. The other
+        # pages of the chunk are queued again as they were, the hung page once
+        # more at lower DPI, and after that it is reported as skipped.
+        nonlocal workers_ended
+        skipped = []
+        while True:
+            try:
+                _, page_key = events_queue.get_nowait()
+            except queue.Empty:
+                return skipped
+            workers_ended += 1
+            for chunk_id, chunk in list(in_flight.items()):
+                hung = [task for task in chunk if (task[1], task[0]) == page_key]
+                if hung:
+                    break
+            else:
+                continue
+            del in_flight[chunk_id]
+            task = hung[0]
+            others = [other for other in chunk if other is not task]
+            if others:
+                submit_chunk(others)
+            task_options = resolve_options(task[5] if len(task) > 5 else None)
+            if task_options['timeout_retry']:
+                result = page_result(task[0], 'skipped', f"Page {task[0] + 1}: Skipped, hung again at lower DPI",
+                                     timed_out='page')
+                result['pdf'] = task[1]
+                skipped.append(result)
+            else:
+                submit_chunk([task[:5] + (timeout_retry_options(task_options),) + task[6:]])
+
+    try:
+        submit(max_pending)
+        while in_flight:
+            yield from handle_hung_pages()
+            try:
+                chunk_id, outcome = finished_chunks.get(timeout=WATCHDOG_POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if in_flight.pop(chunk_id, None) is None:
+                continue
+            if isinstance(outcome, BaseException):
+                raise outcome
+            # Refill before yielding so the workers stay busy while the
+            # caller deals with these results.
+            submit(1)
+            yield from outcome
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        if workers_ended:
+            # The pool waits forever for the chunks of ended workers, so it
+            # cannot be closed and joined. The idle workers flush their
+            # writers on request instead and are then terminated.
+            drain_flag.value = 1
+            collect_writer_stats(stats_queue, pool_workers + workers_ended, writer_stats)
+            pool.terminate()
+        else:
+            pool.close()
+    finally:
+        pool.join()
+    if not workers_ended:
+        collect_writer_stats(stats_queue, pool_workers, writer_stats)
+
+def pool_execution_mode(execution_mode, workers, options):
+    # A single worker without a page timeout gains nothing from a pool. With
+    # one, pages still go to a one-worker pool: a page stuck in native code
+    # can only be stopped by ending the process it runs in.
+    if execution_mode == 'process' and workers == 1 and not options['page_timeout']:
+        return 'sequential'
+    return execution_mode
+
+def collect_writer_stats(stats_queue, count, writer_stats):
+    for _ in range(count):
+        try:
+            merge_writer_stats(writer_stats, stats_queue.get(timeout=5))
+        except queue.Empty:
+            break
+
+class Checkpoint:
+    # Append-only JSON lines manifest of finished pages for one PDF. Every
+    # record is flushed and fsynced before the next page is reported, and a
+    # torn last line from a crash is ignored when the manifest is read back.
+    # The first line identifies the PDF and pattern; a manifest written for a
+    # different file version is set aside instead of resumed.
+    FINISHED_STATUSES = ('saved', 'no_match')
+
+    def __init__(self, path, pdf_path, number_pattern):
+        self.path = path
+        stat = os.stat(pdf_path)
+        self.header = {'pdf': pdf_path, 'size': stat.st_size, 'mtime': stat.st_mtime, 'pattern': number_pattern}
+        self._file = None
+
+    @staticmethod
+    def path_for(output_folder, pdf_path):
+        return os.path.join(output_folder, f"{pdf_stem(pdf_path)}.checkpoint.jsonl")
+
+    def adopt_legacy(self):
+        # Manifests used to be named after the PDF file name alone. One that
+        # belongs to this PDF is renamed so the run can still resume from it.
+        stem = os.path.splitext(os.path.basename(self.header['pdf']))[0]
+        legacy_path = os.path.join(os.path.dirname(self.path), f"{stem}.checkpoint.jsonl")
+        if os.path.exists(self.path) or not os.path.exists(legacy_path):
+            return
+        with open(legacy_path, 'r', encoding='utf-8') as manifest:
+            try:
+                header = json.loads(manifest.readline())
+            except ValueError:
+                return
+        if header.get('pdf') == self.header['pdf']:
+            os.replace(legacy_path, self.path)
+
+    def load(self):
+        # Returns {page_number: result} for pages that do not need to run again.
+        self.adopt_legacy()
+        if not os.path.exists(self.path):
+            return {}
+        records = []
+        with open(self.path, 'r', encoding='utf-8') as manifest:
+            for line in manifest:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        if not records or records[0] != self.header:
+            stale_path = f"{self.path}.stale"
+            os.replace(self.path, stale_path)
+            logging.warning(f"Checkpoint {self.path} does not match {self.header['pdf']}; moved to {stale_path}")
+            return {}
+
+        finished = {}
+        for result in records[1:]:
+            finished[result['page']] = result
+        return {
+            page_number: result for page_number, result in finished.items()
+            if result['status'] in self.FINISHED_STATUSES
+            and (result['status'] != 'saved' or os.path.exists(result['output_path']))
+        }
+
+    @classmethod
+    def reopen(cls, output_folder, pdf_path):
+        # Opens the existing manifest of a PDF that is not part of this run,
+        # for appending only, or returns None when it has none.
+        path = cls.path_for(output_folder, pdf_path)
+        if not os.path.exists(path):
+            return None
+        checkpoint = cls.__new__(cls)
+        checkpoint.path = path
+        checkpoint.header = None
+        checkpoint._file = None
+        return checkpoint.open()
+
+    def open(self):
+        is_new = not os.path.exists(self.path)
+        self._file = open(self.path, 'a+', encoding='utf-8')
+        if is_new:
+            self._write(self.header)
+        else:
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != '\n':
+                    self._file.write('\n')
+        return self
+
+    def record(self, result):
+        self._write(result)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class OutputIndex:
+    # SQLite index of every saved page in an output folder, kept across runs.
+    # One row per source page, looked up by number through an index, so
+    # "which PDF/page had number X" does not depend on how many runs or pages
+    # the folder has seen. Only the parent process writes to it.
+    def __init__(self, path):
+        self.path = path
+        self.run_id = uuid.uuid4().hex
+        self.released = set()  # earlier output files whose pages were all processed again by this run
+        self.moved = {}  # earlier output file -> pages of it processed again by this run
+        self._connection = sqlite3.connect(path, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "pdf TEXT NOT NULL, page INTEGER NOT NULL, number TEXT NOT NULL, output_path TEXT NOT NULL, "
+            "output_page INTEGER, source TEXT, run TEXT NOT NULL, recorded REAL NOT NULL, PRIMARY KEY (pdf, page))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pages_number ON pages (number)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pages_run ON pages (run)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS pages_output_path ON pages (output_path)")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS page_fields (pdf TEXT NOT NULL, page INTEGER NOT NULL, field TEXT NOT NULL, "
+            "value TEXT NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS page_fields_value ON page_fields (field, value)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS page_fields_page ON page_fields (pdf, page)")
+        self._connection.commit()
+
+    def record(self, result):
+        # Pages that no longer have a number, or whose image could not be
+        # written, drop out of the index.
+        if result['status'] not in ('saved', 'no_match') and not result.get('write_failed'):
+            return
+        previous = self._connection.execute("SELECT output_path FROM pages WHERE pdf = ? AND page = ?",
+                                            (result['pdf'], result['page'])).fetchone()
+        self._connection.execute("DELETE FROM page_fields WHERE pdf = ? AND page = ?", (result['pdf'], result['page']))
+        if result['status'] == 'saved':
+            self._connection.execute(
+                "INSERT OR REPLACE INTO pages (pdf, page, number, output_path, output_page, source, run, recorded) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (result['pdf'], result['page'], result['number'], result['output_path'], result.get('bundle_page'),
+                 result.get('source'), self.run_id, time.time())
+            )
+            self._connection.executemany(
+                "INSERT INTO page_fields (pdf, page, field, value) VALUES (?, ?, ?, ?)",
+                [(result['pdf'], result['page'], field, value)
+                 for field, values in (result.get('fields') or {}).items() for value in values]
+            )
+        else:
+            self._connection.execute("DELETE FROM pages WHERE pdf = ? AND page = ?", (result['pdf'], result['page']))
+        self._connection.commit()
+        if previous is not None and previous[0] != result['output_path']:
+            self.moved[previous[0]] = self.moved.get(previous[0], 0) + 1
+        if previous is not None and not self.owners(previous[0]):
+            self.released.add(previous[0])
+
+    def relocate(self, pdf_path, page_number, output_path, output_page=None):
+        self._connection.execute("UPDATE pages SET output_path = ?, output_page = ? WHERE pdf = ? AND page = ?",
+                                 (output_path, output_page, pdf_path, page_number))
+
+    def commit(self):
+        self._connection.commit()
+
+    def lookup(self, value, field=None):
+        # Without a field the value is matched against the number that named
+        # the output; with one, against every value of that field on the page.
+        if field is None:
+            rows = self._connection.execute(
+                "SELECT pdf, page, output_path, output_page, source, run FROM pages WHERE number = ? ORDER BY pdf, page",
+                (value,)
+            )
+        else:
+            rows = self._connection.execute(
+                "SELECT DISTINCT pages.pdf, pages.page, output_path, output_page, source, run FROM page_fields "
+                "JOIN pages ON pages.pdf = page_fields.pdf AND pages.page = page_fields.page "
+                "WHERE field = ? AND value = ? ORDER BY pages.pdf, pages.page", (field, value)
+            )
+        return [{'pdf': pdf, 'page': page, 'output_path': output_path, 'output_page': output_page, 'source': source,
+                 'run': run} for pdf, page, output_path, output_page, source, run in rows]
+
+    def owners(self, output_path):
+        return set(self._connection.execute("SELECT pdf, page FROM pages WHERE output_path = ?", (output_path,)))
+
+    def pending_numbers(self):
+        # (number, [(pdf, page, output_path, output_page, source), ...]) with
+        # every page of each number that still has a page in a part file,
+        # whichever run saved it. Read up front because the caller relocates
+        # the pages.
+        candidates = self._connection.execute(
+            "SELECT number, pdf, page, output_path FROM pages WHERE output_page IS NULL"
+        ).fetchall()
+        numbers = sorted({number for number, pdf_path, page_number, output_path in candidates
+                          if is_part_path(output_path, number, pdf_path, page_number)})
+        for number in numbers:
+            yield number, self._connection.execute(
+                "SELECT pdf, page, output_path, output_page, source FROM pages WHERE number = ? ORDER BY pdf, page",
+                (number,)
+            ).fetchall()
+
+    def close(self):
+        self._connection.close()
+
+def lookup_number(output_folder, number, options=None, field=None):
+    options = resolve_options(options)
+    index_path = os.path.join(output_folder, options['output_index'])
+    if not os.path.exists(index_path):
+        return []
+    index = OutputIndex(index_path)
+    try:
+        return index.lookup(number, field)
+    finally:
+        index.close()
+
+def stream_pdf_pages(pdf_paths, output_folder, number_pattern, crop_ratio, options=None, workers=None, chunksize=1,
+                     execution_mode='process', max_pending=None, cancel=None):
+    # Library entry point for very long inputs: yields each page result as it
+    # finishes. There is no pre-scan and no task list; pages are queued lazily
+    # and each worker checks the text layer itself, so memory stays flat
+    # however many pages the PDFs have. Results are checkpointed the same way
+    # as in process_pdfs, and closing the generator early stops the pool.
+    # No metrics file or run report is written; the caller has every result.
+    # Bundling needs the whole run's pages and is left to process_pdfs.
+    options = resolve_options(options)
+    if options['preprocess_steps'] and np is None:
+        raise RuntimeError("Image preprocessing needs NumPy (pip install numpy)")
+    if options['output_bundle']:
+        raise ValueError("stream_pdf_pages does not support output_bundle; use process_pdfs")
+    checkpoints = {}
+    split_pages = {pdf_path: {} for pdf_path in pdf_paths}
+    index = None
+    if options['output_index']:
+        index = OutputIndex(os.path.join(output_folder, options['output_index']))
+
+    def page_tasks():
+        for pdf_path in pdf_paths:
+            total_pages = len(get_document_session(pdf_path))
+            finished = {}
+            if options['resume']:
+                checkpoint = Checkpoint(Checkpoint.path_for(output_folder, pdf_path), pdf_path, number_pattern)
+                finished = checkpoint.load()
+                checkpoints[pdf_path] = checkpoint.open()
+                if options['split_pdf']:
+                    for result in finished.values():
+                        record_split_page(split_pages, dict(result, pdf=pdf_path))
+            for page_number in range(total_pages):
+                if page_number not in finished:
+                    yield (page_number, pdf_path, output_folder, number_pattern, crop_ratio, options)
+
+    def finish(result):
+        if result['pdf'] in checkpoints:
+            checkpoints[result['pdf']].record(result)
+        if index is not None:
+            index.record(result)
+        if options['split_pdf']:
+            record_split_page(split_pages, result)
+        return result
+
+    try:
+        pool_workers = workers or cpu_count()
+        writer_stats = new_writer_stats()
+        for result in run_page_tasks(page_tasks(), pool_workers, chunksize,
+                                     pool_execution_mode(execution_mode, pool_workers, options), writer_stats,
+                                     max_pending, cancel):
+            yield finish(result)
+        # A page whose image failed to write is yielded again as an error.
+        for result in write_failure_results(writer_stats):
+            yield finish(result)
+        if options['split_pdf']:
+            split_pdfs_by_number(split_pages, output_folder, checkpoints, index, crop_ratio)
+        elif index is not None:
+            group_outputs_by_number(index, output_folder, options, checkpoints)
+    finally:
+        if index is not None:
+            index.close()
+        for checkpoint in checkpoints.values():
+            checkpoint.close()
+        for pdf_path in pdf_paths:
+            close_document_session(pdf_path)
+
+def process_pdfs(pdf_paths, output_folder, number_pattern, crop_ratio, update_progress=None,
+                 options=None, workers=None, chunksize=1, execution_mode='process', report_scan=None,
+                 max_pending=None, cancel=None, only_pages=None):
+    # Pages of every file go through one pool, so the worker budget is shared
+    # across the whole batch instead of being sized per file. A pre-scan
+    # classifies every page first; born-digital pages are only rendered and
+    # saved, while scanned and mixed pages also go through OCR. only_pages
+    # ({pdf_path: page numbers}) limits the run to those pages, as used to
+    # retry the failures listed in a run report.
+    run_started = time.perf_counter()
+    options = resolve_options(options)
+    if options['preprocess_steps'] and np is None:
+        raise RuntimeError("Image preprocessing needs NumPy (pip install numpy)")
+    checkpoints = {}
+    summary = {'files': len(pdf_paths), 'pages': 0, 'saved': 0, 'no_match': 0, 'error': 0, 'skipped': 0,
+               'ocr_skipped': 0}
+    scan = {'digital': 0, 'scanned': 0, 'mixed': 0}
+    completed = 0
+    roi_stats = {}
+    cache_stats = {'hit': 0, 'miss': 0}
+    ocr_stats = {}
+    ocr_pass_stats = {'hunt': 0, 'full': 0}
+    ocr_dpi_stats = {}
+    stage_totals = {}
+    failures = []
+    saved_results = {pdf_path: {} for pdf_path in pdf_paths}
+    split_pages = {pdf_path: {} for pdf_path in pdf_paths}
+    metrics = None
+    index = None
+    if options['output_index']:
+        index = OutputIndex(os.path.join(output_folder, options['output_index']))
+    if options['metrics_file']:
+        metrics = MetricsLog(os.path.join(output_folder, options['metrics_file']))
+
+    def handle_result(result):
+        nonlocal completed
+        completed += 1
+        if result.get('write_failed'):
+            # Replaces the saved result this page was already counted as.
+            completed -= 1
+            summary['saved'] -= 1
+            if result.get('source') == 'text':
+                summary['ocr_skipped'] -= 1
+            # Its part file was never written, so it cannot go into a bundle.
+            saved_results[result['pdf']].pop(result['page'], None)
+        logging.info(f"{result['pdf']}: {result['message']}")
+        if result['pdf'] in checkpoints:
+            checkpoints[result['pdf']].record(result)
+        if metrics is not None:
+            metrics.record(result)
+        if index is not None:
+            index.record(result)
+        if result['status'] == 'saved' and options['output_bundle']:
+            saved_results[result['pdf']][result['page']] = result
+        if options['split_pdf']:
+            record_split_page(split_pages, result)
+        summary[result['status']] += 1
+        if result['status'] == 'saved' and result.get('source') == 'text':
+            summary['ocr_skipped'] += 1
+        if result['status'] in ('error', 'skipped'):
+            failures.append({'pdf': result['pdf'], 'page': result['page'], 'status': result['status'],
+                             'error_type': result.get('error_type'), 'timed_out': result.get('timed_out'),
+                             'message': result['message']})
+        for stage, seconds in result.get('timings', {}).items():
+            stage_totals[stage] = stage_totals.get(stage, 0.0) + seconds
+        record_roi_stats(roi_stats, result)
+        if result.get('ocr_pass'):
+            ocr_pass_stats[result['ocr_pass']] += 1
+        if result.get('ocr_dpi'):
+            ocr_dpi_stats[result['ocr_dpi']] = ocr_dpi_stats.get(result['ocr_dpi'], 0) + 1
+        if result.get('ocr_engine'):
+            engine_stats = ocr_stats.setdefault(result['ocr_engine'], {'calls': 0, 'seconds': 0.0})
+            engine_stats['calls'] += result['ocr_calls']
+            engine_stats['seconds'] += result['timings'].get('ocr', 0.0)
+        if result.get('cache'):
+            cache_stats[result['cache']] += 1
+        if update_progress is not None:
+            update_progress(completed, result)
 
-def process_pdf_with_progress(pdf_path, output_folder, number_pattern, crop_ratio, update_progress, total_pages):
     try:
-        tasks = [(page_number, pdf_path, output_folder, number_pattern, crop_ratio) for page_number in range(total_pages)]
+        ocr_tasks = []
+        render_tasks = []
+        prescan_started = time.perf_counter()
+        for pdf_path in pdf_paths:
+            if cancel is not None and cancel.is_set():
+                break
+            total_pages = len(get_document_session(pdf_path))
+            skip_pages = set()
+            if only_pages is not None:
+                selected = set(only_pages.get(pdf_path, ()))
+                skip_pages = set(range(total_pages)) - selected
+            summary['pages'] += total_pages - len(skip_pages)
+            finished = {}
+            if options['resume']:
+                checkpoint = Checkpoint(Checkpoint.path_for(output_folder, pdf_path), pdf_path, number_pattern)
+                loaded = checkpoint.load()
+                finished = {page_number: result for page_number, result in loaded.items()
+                            if page_number not in skip_pages}
+                checkpoints[pdf_path] = checkpoint.open()
+                # Split PDFs are cut from every known page of the file,
+                # including those left out of this run by only_pages.
+                if options['split_pdf']:
+                    for result in loaded.values():
+                        record_split_page(split_pages, dict(result, pdf=pdf_path))
+                # Likewise the bundle keeps every saved page, not just this run's.
+                if options['output_bundle']:
+                    for result in loaded.values():
+                        if result['status'] == 'saved':
+                            saved_results[pdf_path][result['page']] = result
+                if finished:
+                    logging.info(f"Resuming {pdf_path}: {len(finished)} of {total_pages} pages already finished")
+                    for result in finished.values():
+                        summary[result['status']] += 1
+                        if result.get('source') == 'text':
+                            summary['ocr_skipped'] += 1
+            completed += len(finished)
+
+            skip_pages.update(finished)
+            for page_number, page_info in classify_pdf(pdf_path, number_pattern, skip_pages=skip_pages).items():
+                scan[page_info['class']] += 1
+                task = (page_number, pdf_path, output_folder, number_pattern, crop_ratio, options, page_info)
+                if page_info['class'] == 'digital':
+                    render_tasks.append(task)
+                else:
+                    ocr_tasks.append(task)
+
+        summary['resumed'] = completed
+        scan['ocr_pages'] = len(ocr_tasks)
+        scan['prescan_seconds'] = round(time.perf_counter() - prescan_started, 3)
+        logging.info(f"Pre-scan: {scan['digital']} born-digital pages with a number, {scan['scanned']} scanned, "
+                     f"{scan['mixed']} mixed; {scan['ocr_pages']} pages need OCR")
+        if report_scan is not None:
+            report_scan(scan)
+        if completed and update_progress is not None:
+            update_progress(completed, None)
+
+        # In split-PDF mode a born-digital page needs nothing beyond the
+        # number the pre-scan already found, so it never goes to the pool.
+        if options['split_pdf']:
+            for task in render_tasks:
+                if cancel is not None and cancel.is_set():
+                    break
+                handle_result(process_page(task))
+            render_tasks = []
+
+        # The slow OCR pages are queued first so the cheap render-only pages
+        # fill in behind them instead of leaving a long OCR tail.
+        task_count = len(ocr_tasks) + len(render_tasks)
+        writer_stats = new_writer_stats()
+        if task_count:
+            pool_workers = min(workers or cpu_count(), task_count)
+            tasks = itertools.chain(ocr_tasks, render_tasks)
+            for result in run_page_tasks(tasks, pool_workers, chunksize,
+                                         pool_execution_mode(execution_mode, pool_workers, options), writer_stats,
+                                         max_pending, cancel):
+                handle_result(result)
+            for result in write_failure_results(writer_stats):
+                handle_result(result)
+        summary['cancelled'] = cancel is not None and cancel.is_set()
+        if summary['cancelled']:
+            logging.warning(f"Cancelled with {completed} of {summary['pages']} pages finished")
+
+        summary['writer'] = writer_stats
+        log_writer_stats(writer_stats)
+        if options['split_pdf']:
+            summary['splits'] = split_pdfs_by_number(split_pages, output_folder, checkpoints, index, crop_ratio)
+        elif options['output_bundle']:
+            summary['bundles'] = bundle_saved_results(saved_results, output_folder, options['output_bundle'], checkpoints,
+                                                      index)
+        elif index is not None:
+            summary['groups'] = group_outputs_by_number(index, output_folder, options, checkpoints)
+        log_roi_stats(roi_stats)
+        summary['ocr_engines'] = ocr_stats
+        summary['ocr_passes'] = ocr_pass_stats
+        summary['ocr_dpi_distribution'] = {str(dpi): pages for dpi, pages in sorted(ocr_dpi_stats.items())}
+        if ocr_dpi_stats:
+            logging.info("OCR DPI distribution: " + ", ".join(
+                f"{dpi} DPI: {pages} pages" for dpi, pages in sorted(ocr_dpi_stats.items())))
+        if options['number_hunt']:
+            logging.info(f"Number hunt: {ocr_pass_stats['hunt']} pages settled by the digits-only pass, "
+                         f"{ocr_pass_stats['full']} escalated to full OCR")
+        for engine_name, engine_stats in ocr_stats.items():
+            calls_per_second = engine_stats['calls'] / engine_stats['seconds'] if engine_stats['seconds'] else 0.0
+            logging.info(f"OCR engine {engine_name}: {engine_stats['calls']} calls in {engine_stats['seconds']:.2f}s "
+                         f"({calls_per_second:.2f} calls/s per worker)")
+        if options['ocr_cache_path']:
+            logging.info(f"OCR cache: {cache_stats['hit']} hits, {cache_stats['miss']} misses")
+    finally:
+        if metrics is not None:
+            summary['stages'] = metrics.close({'prescan_seconds': scan.get('prescan_seconds'),
+                                               'writer': summary.get('writer'),
+                                               'ocr_dpi_distribution': summary.get('ocr_dpi_distribution')})
+            log_stage_summary(summary['stages'])
+        if index is not None:
+            index.close()
+        for checkpoint in checkpoints.values():
+            checkpoint.close()
+        for pdf_path in pdf_paths:
+            close_document_session(pdf_path)
+    summary.update(scan)
+    summary['seconds'] = round(time.perf_counter() - run_started, 3)
+    if options['report_file']:
+        report = build_run_report(summary, failures, stage_totals, pdf_paths, number_pattern, crop_ratio)
+        summary['report'] = write_run_report(os.path.join(output_folder, options['report_file']), report)
+    return summary
+
+def output_file_stats(files):
+    # Totals over the {path: {'pages', 'bytes', 'seconds'}} of bundle, group
+    # or split files, with the files themselves.
+    return {
+        'files': len(files),
+        'pages': sum(stats['pages'] for stats in files.values()),
+        'bytes': sum(stats['bytes'] for stats in files.values()),
+        'seconds': round(sum(stats['seconds'] for stats in files.values()), 3),
+        'by_file': {path: dict(stats, seconds=round(stats['seconds'], 3)) for path, stats in files.items()},
+    }
+
+def build_run_report(summary, failures, stage_totals, pdf_paths, number_pattern, crop_ratio):
+    processed = summary['pages'] - summary.get('resumed', 0)
+    writer = summary.get('writer') or new_writer_stats()
+    errors_by_type = {}
+    for failure in failures:
+        error_type = failure['error_type'] or (f"timeout ({failure['timed_out']})" if failure['timed_out'] else 'unknown')
+        errors_by_type[error_type] = errors_by_type.get(error_type, 0) + 1
+    return {
+        'finished': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'seconds': summary['seconds'],
+        'pages_per_second': round(processed / summary['seconds'], 3) if summary['seconds'] else None,
+        'pdfs': list(pdf_paths),
+        'pattern': number_pattern,
+        'crop_ratio': crop_ratio,
+        'cancelled': summary.get('cancelled', False),
+        'totals': {
+            'pages': summary['pages'],
+            'resumed': summary.get('resumed', 0),
+            'processed': processed,
+            'text_hits': summary['ocr_skipped'],
+            'ocr_hits': summary['saved'] - summary['ocr_skipped'],
+            'no_match': summary['no_match'],
+            'skipped': summary['skipped'],
+            'errors': summary['error'],
+        },
+        'errors_by_type': errors_by_type,
+        'stage_seconds': {stage: round(seconds, 3) for stage, seconds in sorted(stage_totals.items())},
+        # Encoding and writing happen on the writer threads; the 'save' stage
+        # above only covers handing the image over.
+        'writer': {
+            'images': writer['images'],
+            'bytes': writer['bytes'],
+            'write_errors': writer['errors'],
+            'write_seconds': round(writer['write_seconds'], 3),
+            'wait_seconds': round(writer['wait_seconds'], 3),
+            'formats': {output_format: dict(stats, write_seconds=round(stats['write_seconds'], 3))
+                        for output_format, stats in writer['formats'].items()},
+        },
+        'outputs': {kind: output_file_stats(summary[kind]) for kind in ('groups', 'bundles', 'splits')
+                    if summary.get(kind)},
+        'failed_pages': sorted(failures, key=lambda failure: (failure['pdf'], failure['page'])),
+    }
+
+def format_run_report(report):
+    totals = report['totals']
+    lines = [
+        f"Run finished {report['finished']} after {format_duration(report['seconds'])}"
+        + (f" ({report['pages_per_second']:.2f} pages/s)" if report['pages_per_second'] else "")
+        + (", cancelled" if report['cancelled'] else ""),
+        f"Pages: {totals['pages']} ({totals['resumed']} already done by an earlier run, {totals['processed']} processed)",
+        f"  Saved from the text layer: {totals['text_hits']}",
+        f"  Saved from OCR:            {totals['ocr_hits']}",
+        f"  No number found:           {totals['no_match']}",
+        f"  Skipped after timeouts:    {totals['skipped']}",
+        f"  Errors:                    {totals['errors']}",
+    ]
+    if report['stage_seconds']:
+        lines.append("Time per stage, summed over workers: " + ", ".join(
+            f"{'save (hand-off to the writer)' if stage == 'save' else stage} {seconds:.1f}s"
+            for stage, seconds in report['stage_seconds'].items()))
+    writer = report['writer']
+    if writer['images'] or writer['write_errors']:
+        lines.append(f"Encoding and writing: {writer['images']} images, {writer['bytes'] / 1048576:.1f} MB, "
+                     f"{writer['write_seconds']:.1f}s on the writer threads, {writer['wait_seconds']:.1f}s waiting "
+                     f"for a free slot, {writer['write_errors']} write errors")
+        for output_format, stats in writer['formats'].items():
+            average = stats['bytes'] / stats['images'] / 1024 if stats['images'] else 0.0
+            lines.append(f"  {output_format}: {stats['images']} images, {average:.1f} KB each, "
+                         f"{stats['write_seconds']:.1f}s")
+    for kind, label in (('groups', "Grouped"), ('bundles', "Bundled"), ('splits', "Split")):
+        outputs = report['outputs'].get(kind)
+        if outputs:
+            lines.append(f"{label}: {outputs['pages']} pages into {outputs['files']} files, "
+                         f"{outputs['bytes'] / 1048576:.1f} MB in {outputs['seconds']:.1f}s")
+    if report['failed_pages']:
+        lines.append("Failed pages:")
+        for failure in report['failed_pages']:
+            reason = failure['error_type'] or failure['status']
+            lines.append(f"  {failure['pdf']} page {failure['page'] + 1}: {reason}: {failure['message']}")
+        lines.append("Run again with --retry-failed to process only these pages.")
+    return '\n'.join(lines) + '\n'
+
+def write_run_report(path, report):
+    # The JSON report drives --retry-failed; the .txt next to it is for people.
+    with open(path, 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    with open(os.path.splitext(path)[0] + '.txt', 'w', encoding='utf-8') as summary_file:
+        summary_file.write(format_run_report(report))
+    return path
+
+def load_failed_pages(report_path):
+    # Returns ({pdf_path: [page numbers]}, report) for the error and skipped
+    # pages of an earlier run.
+    with open(report_path, 'r', encoding='utf-8') as report_file:
+        report = json.load(report_file)
+    failed_pages = {}
+    for failure in report['failed_pages']:
+        failed_pages.setdefault(failure['pdf'], []).append(failure['page'])
+    return failed_pages, report
+
+# Upper bounds in seconds of the histogram buckets in the metrics summary.
+METRICS_HISTOGRAM_BOUNDS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class MetricsLog:
+    # Writes one JSON line per page and a closing summary with per-stage
+    # percentiles and histograms to the metrics file in the output folder.
+    def __init__(self, path):
+        self.path = path
+        self.run_id = time.strftime('%Y%m%dT%H%M%S')
+        self.stage_samples = {}
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, result):
+        for stage, seconds in result.get('timings', {}).items():
+            self.stage_samples.setdefault(stage, []).append(seconds)
+        self._write({
+            'type': 'page', 'run': self.run_id, 'pdf': result['pdf'], 'page': result['page'] + 1,
+            'status': result['status'], 'source': result.get('source'), 'worker': result.get('worker'),
+            'dpi': result.get('dpi'), 'ocr_dpi': result.get('ocr_dpi'), 'image_size': result.get('image_size'), 'timings': result.get('timings', {}),
+        })
+
+    def summarize(self):
+        return {stage: summarize_durations(samples) for stage, samples in self.stage_samples.items()}
+
+    def close(self, extra=None):
+        stages = self.summarize()
+        self._write(dict({'type': 'summary', 'run': self.run_id, 'stages': stages}, **(extra or {})))
+        self._file.close()
+        return stages
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+def summarize_durations(samples):
+    ordered = sorted(samples)
+    histogram = {}
+    for bound in METRICS_HISTOGRAM_BOUNDS:
+        histogram[f"<{bound}s"] = 0
+    histogram[f">={METRICS_HISTOGRAM_BOUNDS[-1]}s"] = 0
+    for seconds in ordered:
+        for bound in METRICS_HISTOGRAM_BOUNDS:
+            if seconds < bound:
+                histogram[f"<{bound}s"] += 1
+                break
+        else:
+            histogram[f">={METRICS_HISTOGRAM_BOUNDS[-1]}s"] += 1
+
+    def percentile(fraction):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 6)
+
+    return {
+        'count': len(ordered),
+        'total': round(sum(ordered), 6),
+        'mean': round(statistics.fmean(ordered), 6),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': round(ordered[-1], 6),
+        'histogram': histogram,
+    }
+
+def log_stage_summary(stages):
+    for stage, stats in sorted(stages.items(), key=lambda item: -item[1]['total']):
+        logging.info(f"Stage {stage}: {stats['count']} pages, {stats['total']:.2f}s total, mean {stats['mean'] * 1000:.1f}ms, "
+                     f"p50 {stats['p50'] * 1000:.1f}ms, p90 {stats['p90'] * 1000:.1f}ms, p99 {stats['p99'] * 1000:.1f}ms")
+
+def bundle_saved_results(saved_results, output_folder, bundle_format, checkpoints, index=None):
+    # Replaces the per-page images of each PDF with one multi-page file. The
+    # bundle already written by an earlier run of the same job is rebuilt
+    # with its pages plus the new ones, in page order, so a resumed or
+    # --retry-failed run adds to it instead of replacing it. The checkpoint
+    # gets a follow-up record per page pointing at its place in the bundle,
+    # so a later resume still sees those pages as finished.
+    extension = '.pdf' if bundle_format == 'pdf' else '.tif'
+    bundles = {}
+    part_paths = set()
+    for pdf_path, results in saved_results.items():
+        bundle_path = os.path.join(output_folder, f"{pdf_stem(pdf_path)}_pages{extension}")
+        # Pages an earlier run grouped by number stay in their group file,
+        # and pages bundled into another format stay where they are.
+        new_pages = {page_number: result for page_number, result in results.items()
+                     if 'bundle_page' not in result and result.get('group_page') is None}
+        if not new_pages:
+            continue
+        bundled_pages = {page_number: result for page_number, result in results.items()
+                         if 'bundle_page' in result and result['output_path'] == bundle_path
+                         and page_number not in new_pages}
+        if bundled_pages and not os.path.exists(bundle_path):
+            bundled_pages = {}
+        pages = {**bundled_pages, **new_pages}
+        image_pages = []
+        for page_number in sorted(pages):
+            result = pages[page_number]
+            if page_number in new_pages:
+                image_pages.append((result['output_path'], 0))
+            else:
+                image_pages.append((bundle_path, result['bundle_page']))
+        # The earlier bundle is read while the new one is written, so the new
+        # one goes to a temporary file first.
+        bundle_stats = bundle_output_images(image_pages, temporary_path(bundle_path), bundle_format)
+        os.replace(temporary_path(bundle_path), bundle_path)
+        logging.info(f"Bundled {bundle_stats['pages']} pages of {pdf_path} into {bundle_path} "
+                     f"({len(bundled_pages)} from the earlier bundle): "
+                     f"{bundle_stats['bytes']} bytes in {bundle_stats['seconds']:.2f}s")
+        bundles[bundle_path] = bundle_stats
+        part_paths.update(result['output_path'] for result in new_pages.values())
+        for bundle_page, page_number in enumerate(sorted(pages)):
+            result = dict(pages[page_number], output_path=bundle_path, bundle_page=bundle_page)
+            if pdf_path in checkpoints:
+                checkpoints[pdf_path].record(result)
+            if index is not None:
+                index.relocate(pdf_path, page_number, bundle_path, bundle_page)
+    if index is not None:
+        index.commit()
+
+    # Parts can be shared between PDFs that found the same number, so they
+    # are only removed once every bundle has been written.
+    for part_path in part_paths:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    return bundles
+
+def free_output_path(index, output_folder, number_series, extension, sources):
+    # The first of NUMBER, NUMBER_2, NUMBER_3, ... that is unused or only
+    # holds pages that are about to be replaced by the same source pages.
+    # Files the index knows nothing about are never overwritten.
+    stem = safe_file_name(number_series)
+    suffix = 1
+    while True:
+        name = stem if suffix == 1 else f"{stem}_{suffix}"
+        path = os.path.join(output_folder, f"{name}{extension}")
+        if not os.path.exists(path):
+            return path
+        owners = index.owners(path)
+        if owners <= sources and (owners or path in index.released):
+            return path
+        suffix += 1
+
+def output_page_count(output_path):
+    if output_path.endswith('.pdf'):
+        with fitz.open(output_path) as document:
+            return len(document)
+    with Image.open(output_path) as image:
+        return getattr(image, 'n_frames', 1)
+
+def group_outputs_by_number(index, output_folder, options, checkpoints):
+    # Gives each number with pages still in part files its final name: a
+    # single page is renamed to NUMBER.png (or the chosen format), several
+    # pages with the same number are combined into one multi-page NUMBER.tif
+    # or .pdf. Part files left by a run that stopped early are picked up by
+    # the next one, and a number that already has an output file from an
+    # earlier run is merged with it, so each number keeps a single file. The
+    # index and the checkpoints of this run's PDFs are pointed at the result.
+    extension = OUTPUT_FORMATS[options['output_format']]['extension']
+    groups = {}
+    earlier_checkpoints = {}  # PDFs of earlier runs whose pages were merged
+    for number_series, rows in index.pending_numbers():
+        parts = []
+        earlier = {}
+        for pdf_path, page_number, output_path, output_page, source in rows:
+            if not os.path.exists(output_path):
+                continue
+            if is_part_path(output_path, number_series, pdf_path, page_number):
+                parts.append((pdf_path, page_number, (output_path, 0), source))
+            elif is_number_output(output_path, number_series):
+                earlier.setdefault(output_path, []).append((pdf_path, page_number, (output_path, output_page or 0), source))
+        # An earlier file is only taken apart when the index accounts for
+        # every page in it, either still pointing at it or processed again by
+        # this run; anything else (a split PDF, a file edited by hand) is
+        # left alone.
+        earlier = {output_path: pages for output_path, pages in earlier.items()
+                   if output_page_count(output_path) == len(pages) + index.moved.get(output_path, 0)}
+        if not parts:
+            continue
+        pages = sorted(parts + [page for pages in earlier.values() for page in pages], key=lambda page: page[:2])
+        sources = {(pdf_path, page_number) for pdf_path, page_number, _, _ in pages}
+        if len(pages) == 1:
+            output_path = free_output_path(index, output_folder, number_series, extension, sources)
+            os.replace(pages[0][2][0], output_path)
+        else:
+            group_format = 'pdf' if any(path.endswith('.pdf') for path in earlier) else options['group_format']
+            group_extension = '.pdf' if group_format == 'pdf' else '.tif'
+            output_path = free_output_path(index, output_folder, number_series, group_extension, sources)
+            # The group may replace a file it reads from, so it is written
+            # aside first.
+            groups[output_path] = bundle_output_images([page[2] for page in pages], temporary_path(output_path),
+                                                       group_format)
+            os.replace(temporary_path(output_path), output_path)
+            logging.info(f"Number {number_series} found on {len(pages)} pages; grouped into {output_path}")
+            for old_path in {page[2][0] for page in pages} - {output_path}:
+                os.remove(old_path)
+        for position, (pdf_path, page_number, _, source) in enumerate(pages):
+            output_page = position if len(pages) > 1 else None
+            index.relocate(pdf_path, page_number, output_path, output_page)
+            checkpoint = checkpoints.get(pdf_path) or earlier_checkpoints.get(pdf_path)
+            if checkpoint is None and pdf_path not in earlier_checkpoints:
+                checkpoint = earlier_checkpoints[pdf_path] = Checkpoint.reopen(output_folder, pdf_path)
+            if checkpoint is not None:
+                checkpoint.record(page_result(
+                    page_number, 'saved', f"Page {page_number + 1}: Image saved as {output_path}",
+                    number=number_series, output_path=output_path, source=source, group_page=output_page))
+    index.commit()
+    for checkpoint in earlier_checkpoints.values():
+        if checkpoint is not None:
+            checkpoint.close()
+    return groups
+
+def record_split_page(split_pages, result):
+    # Remembers what split_pdfs_by_number needs from a finished page: its
+    # number, or None when the page had none.
+    if result['status'] in Checkpoint.FINISHED_STATUSES:
+        split_pages[result['pdf']][result['page']] = (result['number'], result.get('source'))
 
-        for i, task in enumerate(tasks):
-            process_page(task)
-            update_progress(i + 1)
+def split_pdfs_by_number(split_pages, output_folder, checkpoints, index=None, crop_ratio=None):
+    # Writes one NUMBER.pdf per number by copying the source pages with
+    # insert_pdf, so nothing is rendered or re-encoded. A crop_ratio becomes
+    # each page's cropbox, which hides the margin without removing it. A page
+    # with a number starts a part and the pages after it without one belong
+    # to it, up to the next number. Pages that failed or were not processed
+    # end a part, and pages before the first number of a file are left out.
+    # Parts with the same number, from one PDF or several, go into the same
+    # file.
+    parts = {}
+    for pdf_path, pages in split_pages.items():
+        part = None
+        for page_number in range(len(get_document_session(pdf_path))):
+            number_series, source = pages.get(page_number, (None, None))
+            if page_number not in pages:
+                part = None
+            elif number_series is None:
+                if part is not None:
+                    part['last'] = page_number
+            elif part is not None and part['number'] == number_series and part['last'] == page_number - 1:
+                part['last'] = page_number
+                part['hits'].append((page_number, source))
+            else:
+                part = {'pdf': pdf_path, 'number': number_series, 'first': page_number, 'last': page_number,
+                        'hits': [(page_number, source)]}
+                parts.setdefault(number_series, []).append(part)
+        unassigned = min([page_number for page_number, (number_series, _) in pages.items() if number_series],
+                         default=len(pages))
+        if unassigned:
+            logging.info(f"{pdf_path}: {unassigned} pages before the first number are not in any split PDF")
 
+    splits = {}
+    for number_series, number_parts in parts.items():
+        started = time.perf_counter()
+        sources = {(part['pdf'], page_number) for part in number_parts for page_number, _ in part['hits']}
+        if index is not None:
+            output_path = free_output_path(index, output_folder, number_series, '.pdf', sources)
+        else:
+            output_path = split_pdf_path(output_folder, number_series)
+        split = fitz.open()
+        for part in number_parts:
+            with get_document_session(part['pdf']).document() as document:
+                split.insert_pdf(document, from_page=part['first'], to_page=part['last'])
+        page_count = len(split)
+        if crop_ratio is not None and crop_ratio < 1:
+            for page in split:
+                crop_page(page, crop_ratio)
+        split.save(output_path, garbage=3, deflate=True)
+        split.close()
+
+        offset = 0
+        for part in number_parts:
+            for page_number, source in part['hits']:
+                output_page = offset + page_number - part['first']
+                if index is not None:
+                    index.relocate(part['pdf'], page_number, output_path, output_page)
+                if part['pdf'] in checkpoints:
+                    checkpoints[part['pdf']].record(page_result(
+                        page_number, 'saved', f"Page {page_number + 1}: Split into {output_path}",
+                        number=number_series, output_path=output_path, source=source, group_page=output_page))
+            offset += part['last'] - part['first'] + 1
+        splits[output_path] = {'pages': page_count, 'bytes': os.path.getsize(output_path),
+                               'seconds': time.perf_counter() - started}
+        logging.info(f"Number {number_series}: {page_count} pages split into {output_path}")
+    if index is not None:
+        index.commit()
+    return splits
+
+def process_pdf_with_progress(pdf_path, output_folder, number_pattern, crop_ratio, update_progress, total_pages,
+                              options=None, workers=None, chunksize=1, execution_mode='process', cancel=None):
+    try:
+        return process_pdfs([pdf_path], output_folder, number_pattern, crop_ratio, update_progress,
+                            options=options, workers=workers, chunksize=chunksize, execution_mode=execution_mode,
+                            cancel=cancel)
     except Exception as e:
         logging.error(f"An error occurred during multiprocessing: {e}")
 
+def expand_pdf_inputs(inputs):
+    pdf_paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, '*.pdf')) + glob.glob(os.path.join(item, '*.PDF'))
+        elif glob.has_magic(item):
+            matches = glob.glob(item)
+        else:
+            matches = [item]
+        for match in sorted(matches):
+            pdf_path = normalize_path(match)
+            if pdf_path not in pdf_paths:
+                pdf_paths.append(pdf_path)
+    return pdf_paths
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description="Find a number series on each PDF page and save the matching pages as images.")
+    parser.add_argument('inputs', nargs='*', help="PDF files, glob patterns or directories of PDFs")
+    parser.add_argument('-o', '--output', required=True, help="Output folder")
+    parser.add_argument('--pattern', default=r'\d{10}', help="Regular expression for the number series")
+    parser.add_argument('--fields', choices=list(FIELD_PRESETS), default=None,
+                        help="Extract a preset set of named fields; its first field replaces --pattern")
+    parser.add_argument('--field', action='append', default=[], metavar='NAME=REGEX',
+                        help="Also extract a named field; may be given more than once")
+    parser.add_argument('--name-field', default=None, help="Field whose value names the output files")
+    parser.add_argument('--crop-ratio', type=float, default=0.95)
+    parser.add_argument('--output-dpi', '--dpi', dest='output_dpi', type=int, default=DEFAULT_OPTIONS['output_dpi'],
+                        help="Resolution of the saved page images")
+    parser.add_argument('--ocr-dpi', type=int, nargs='+', default=list(DEFAULT_OPTIONS['ocr_dpi_ladder']),
+                        help="OCR render resolutions, tried from the first until a confident match is found")
+    parser.add_argument('--min-ocr-confidence', type=float, default=DEFAULT_OPTIONS['min_ocr_confidence'])
+    parser.add_argument('--render-backend', choices=['pymupdf', 'poppler'], default=DEFAULT_OPTIONS['render_backend'])
+    parser.add_argument('--format', choices=list(OUTPUT_FORMATS), default=DEFAULT_OPTIONS['output_format'],
+                        help="Encoding of the saved pages")
+    parser.add_argument('--jpeg-quality', type=int, default=DEFAULT_OPTIONS['jpeg_quality'])
+    parser.add_argument('--bundle', choices=['tiff', 'pdf'], default=None,
+                        help="Combine the saved pages of each PDF into one multi-page file")
+    parser.add_argument('--group-format', choices=['tiff', 'pdf'], default=DEFAULT_OPTIONS['group_format'],
+                        help="Multi-page file for a number found on several pages")
+    parser.add_argument('--split-pdf', action='store_true',
+                        help="Write one PDF per number by copying the original pages instead of saving images")
+    parser.add_argument('--lookup', metavar='NUMBER', default=None,
+                        help="List the PDF pages recorded for NUMBER in the output folder's index and exit")
+    parser.add_argument('--lookup-field', default=None, help="Match --lookup against this field instead of the number")
+    parser.add_argument('--ocr-engine', choices=['auto', 'tesserocr', 'pytesseract'], default=DEFAULT_OPTIONS['ocr_engine'],
+                        help="tesserocr keeps Tesseract loaded in each worker; pytesseract starts tesseract.exe per call")
+    parser.add_argument('--no-number-hunt', action='store_true',
+                        help="Skip the digits-only OCR pass and always run full English OCR")
+    parser.add_argument('--preprocess', nargs='*', choices=PREPROCESS_STEPS, default=None,
+                        help="Clean up scanned pages before OCR; with no steps listed all of them are applied")
+    parser.add_argument('--roi-template', default=DEFAULT_OPTIONS['roi_template'],
+                        help=f"One of {', '.join(ROI_TEMPLATES)} or 'none' to OCR full pages only")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes shared by all files (default: CPU count)")
+    parser.add_argument('--chunksize', type=int, default=1)
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help="Chunks queued or unconsumed at any time (default: two per worker)")
+    parser.add_argument('--sequential', action='store_true', help="Process pages in this process without a pool; --page-timeout does not apply, "
+                             "so a page that hangs stops the run")
+    parser.add_argument('--no-cache', action='store_true', help="Do not read or write the OCR cache")
+    parser.add_argument('--cache-path', default=DEFAULT_OPTIONS['ocr_cache_path'],
+                        help="OCR cache database (default: %(default)s)")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore existing checkpoints and process every page")
+    parser.add_argument('--ocr-timeout', type=float, default=DEFAULT_OPTIONS['ocr_timeout'],
+                        help="Seconds per Tesseract call, 0 for no limit")
+    parser.add_argument('--render-timeout', type=float, default=DEFAULT_OPTIONS['render_timeout'],
+                        help="Seconds per poppler render, 0 for no limit")
+    parser.add_argument('--page-timeout', type=float, default=DEFAULT_OPTIONS['page_timeout'],
+                        help="Seconds before a worker stuck on one page is replaced, 0 for no limit")
+    parser.add_argument('--retry-failed', nargs='?', const='', default=None, metavar='REPORT',
+                        help="Process only the error and skipped pages listed in a run report "
+                             "(default: the report in the output folder)")
+    return parser
+
+def run_cli(argv):
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.lookup:
+        hits = lookup_number(normalize_path(args.output), args.lookup, field=args.lookup_field)
+        for hit in hits:
+            location = hit['output_path'] if hit['output_page'] is None else f"{hit['output_path']} page {hit['output_page'] + 1}"
+            print(f"{hit['pdf']} page {hit['page'] + 1}: {location}")
+        if not hits:
+            print(f"{args.lookup} is not in the index.")
+        return 0 if hits else 1
+    only_pages = None
+    if args.retry_failed is not None:
+        # The pattern and crop ratio come from the report so the retried pages
+        # match the checkpoints of the run that failed them.
+        report_path = args.retry_failed or os.path.join(normalize_path(args.output), DEFAULT_OPTIONS['report_file'])
+        try:
+            only_pages, report = load_failed_pages(report_path)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Cannot read the run report {report_path}: {e}")
+        if not only_pages:
+            print(f"No failed pages in {report_path}.")
+            return 0
+        if args.inputs:
+            selected = set(expand_pdf_inputs(args.inputs))
+            only_pages = {pdf_path: pages for pdf_path, pages in only_pages.items() if pdf_path in selected}
+        args.inputs = list(only_pages)
+        args.pattern, args.crop_ratio = report['pattern'], report['crop_ratio']
+    elif not args.inputs:
+        parser.error("At least one PDF file, pattern or folder is required.")
+    pdf_paths = expand_pdf_inputs(args.inputs) if only_pages is None else list(only_pages)
+    missing = [pdf_path for pdf_path in pdf_paths if not os.path.isfile(pdf_path)]
+    if missing:
+        parser.error(f"The PDF file does not exist: {missing[0]}")
+    if not pdf_paths:
+        parser.error("No PDF files found.")
+    if args.ocr_engine == 'tesserocr' and tesserocr is None:
+        parser.error("--ocr-engine tesserocr needs the tesserocr package.")
+    if args.roi_template != 'none' and args.roi_template not in ROI_TEMPLATES:
+        parser.error(f"Unknown ROI template: {args.roi_template}")
+    if args.split_pdf and args.bundle:
+        parser.error("--split-pdf and --bundle cannot be combined.")
+
+    # A single pattern stays a plain string so existing checkpoints and OCR
+    # cache entries still match.
+    number_pattern = args.pattern
+    if only_pages is None and (args.fields or args.field or args.name_field):
+        patterns = dict(FIELD_PRESETS[args.fields]) if args.fields else {'number': args.pattern}
+        for definition in args.field:
+            name, separator, pattern = definition.partition('=')
+            if not separator:
+                parser.error(f"--field needs NAME=REGEX: {definition}")
+            patterns[name] = pattern
+        if args.name_field:
+            if args.name_field not in patterns:
+                parser.error(f"Unknown --name-field {args.name_field}; fields are {', '.join(patterns)}")
+            patterns = {args.name_field: patterns[args.name_field], **patterns}
+        try:
+            PatternSet(patterns)
+        except (ValueError, re.error) as e:
+            parser.error(f"Invalid field pattern: {e}")
+        number_pattern = patterns
+
+    output_folder = normalize_path(args.output)
+    if not create_output_folder(output_folder):
+        parser.error(f"Failed to create output folder: {output_folder}")
+
+    options = {
+        'group_format': args.group_format,
+        'split_pdf': args.split_pdf,
+        'output_dpi': args.output_dpi,
+        'ocr_dpi_ladder': tuple(args.ocr_dpi),
+        'min_ocr_confidence': args.min_ocr_confidence,
+        'render_backend': args.render_backend,
+        'roi_template': None if args.roi_template == 'none' else args.roi_template,
+        'ocr_engine': args.ocr_engine,
+        'number_hunt': not args.no_number_hunt,
+        'preprocess_steps': () if args.preprocess is None else tuple(args.preprocess or PREPROCESS_STEPS),
+        'output_format': args.format,
+        'jpeg_quality': args.jpeg_quality,
+        'output_bundle': args.bundle,
+        'resume': not args.no_resume,
+        'ocr_timeout': args.ocr_timeout,
+        'render_timeout': args.render_timeout,
+        'page_timeout': args.page_timeout,
+        'ocr_cache_path': None if args.no_cache else normalize_path(args.cache_path),
+    }
+
+    def print_progress(completed, result):
+        if result is not None:
+            print(f"[{completed}] {os.path.basename(result['pdf'])}: {result['message']}")
+
+    def print_scan(scan):
+        print(f"Pre-scan: {scan['digital']} born-digital, {scan['scanned']} scanned, {scan['mixed']} mixed; "
+              f"{scan['ocr_pages']} pages need OCR")
+
+    # The first Ctrl+C lets the pages in flight finish and stops; a second
+    # one aborts straight away.
+    cancel = threading.Event()
+
+    def request_cancel(signum, frame):
+        if cancel.is_set():
+            raise KeyboardInterrupt
+        cancel.set()
+        print("Cancelling after the pages in progress; press Ctrl+C again to abort.")
+
+    previous_handler = signal.signal(signal.SIGINT, request_cancel)
+    try:
+        summary = process_pdfs(pdf_paths, output_folder, number_pattern, args.crop_ratio, print_progress,
+                               options=options, workers=args.workers, chunksize=args.chunksize,
+                               max_pending=args.max_pending, execution_mode='sequential' if args.sequential else 'process',
+                               report_scan=print_scan, cancel=cancel, only_pages=only_pages)
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    print(f"{summary['files']} files, {summary['pages']} pages: {summary['saved']} saved "
+          f"({summary['ocr_skipped']} from the text layer without OCR), {summary['no_match']} without a match, "
+          f"{summary['skipped']} skipped after timeouts, {summary['error']} errors"
+          + (" (cancelled)" if summary['cancelled'] else ""))
+    if summary.get('ocr_dpi_distribution'):
+        print("OCR DPI: " + ", ".join(f"{dpi} DPI x {pages}" for dpi, pages in summary['ocr_dpi_distribution'].items()))
+    if summary.get('report'):
+        print(f"Run report: {summary['report']}")
+    return 1 if summary['error'] or summary['skipped'] or summary['cancelled'] else 0
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+class ProgressTracker:
+    # Turns page results into the figures shown in the GUI. Only the Tk
+    # thread touches it; results reach it through progress_queue.
+    def __init__(self, total_pages):
+        self.total_pages = total_pages
+        self.completed = 0
+        self.resumed = 0
+        self.started = time.perf_counter()
+        self.counts = {'text': 0, 'ocr': 0, 'skipped': 0, 'error': 0}
+
+    def update(self, completed, result):
+        if result is None:
+            # Pages finished by an earlier run; they do not count towards the rate.
+            self.resumed = completed
+        elif result['status'] in ('error', 'skipped'):
+            self.counts[result['status']] += 1
+            if result.get('write_failed'):
+                # The page was counted as saved before its write failed.
+                self.counts['text' if result.get('source') == 'text' else 'ocr'] -= 1
+        elif result.get('source') == 'text':
+            self.counts['text'] += 1
+        else:
+            self.counts['ocr'] += 1
+        self.completed = completed
+
+    def pages_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return (self.completed - self.resumed) / elapsed if elapsed > 0 else 0.0
+
+    def status_text(self):
+        rate = self.pages_per_second()
+        remaining = max(0, self.total_pages - self.completed)
+        eta = format_duration(remaining / rate) if rate else '--:--'
+        return f"{self.completed}/{self.total_pages} pages, {rate:.1f} pages/s, ETA {eta}"
+
+    def counts_text(self):
+        return (f"Text layer: {self.counts['text']}   OCR: {self.counts['ocr']}   "
+                f"Skipped: {self.counts['skipped']}   Errors: {self.counts['error']}")
+
 def start_convert_pdf():
+    global progress_tracker, cancel_event
     try:
         Tk().withdraw()
         pdf_file_path = askopenfilename(title="Select a PDF File", filetypes=[("PDF Files", "*.pdf")])
@@ -107,43 +2561,110 @@ def start_convert_pdf():
             if not create_output_folder(output_folder_name):
                 raise ValueError("Failed to create output folder.")
 
-        pdf_document = fitz.open(pdf_file_path)
-        total_pages = len(pdf_document)
-        pdf_document.close()
+        total_pages = len(get_document_session(pdf_file_path))
 
         progress_var.set(0)
         progress_bar['maximum'] = total_pages
+        progress_tracker = ProgressTracker(total_pages)
+        cancel_event = threading.Event()
+        status_label.config(text=progress_tracker.status_text())
+        counts_label.config(text=progress_tracker.counts_text())
+        convert_button.config(state='disabled')
+        cancel_button.config(state='normal')
 
-        def update_progress(value):
-            progress_var.set(value)
-            root.update_idletasks()
+        # Called from the processing thread. It only queues the result, so
+        # processing never waits on Tk; poll_progress does the drawing.
+        def update_progress(completed, result):
+            progress_queue.put(('progress', completed, result))
 
-        def run_processing():
-            process_pdf_with_progress(pdf_file_path, output_folder_name, r'\d{10}', 0.95, update_progress, total_pages)
+        def run_processing(cancel):
+            summary = process_pdf_with_progress(pdf_file_path, output_folder_name, r'\d{10}', 0.95, update_progress,
+                                                total_pages, cancel=cancel)
+            progress_queue.put(('finished', summary, None))
 
-        threading.Thread(target=run_processing).start()
+        threading.Thread(target=run_processing, args=(cancel_event,)).start()
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
 
+def poll_progress():
+    # Drains everything queued since the last tick and redraws once.
+    finished = False
+    summary = None
+    try:
+        while True:
+            event, value, result = progress_queue.get_nowait()
+            if event == 'progress':
+                progress_tracker.update(value, result)
+            else:
+                finished, summary = True, value
+    except queue.Empty:
+        pass
+    if progress_tracker is not None:
+        progress_var.set(progress_tracker.completed)
+        status_label.config(text=progress_tracker.status_text())
+        counts_label.config(text=progress_tracker.counts_text())
+    if finished:
+        if summary is None:
+            status_label.config(text="Failed; see pdf_processing.log")
+        elif summary.get('cancelled'):
+            status_label.config(text=f"Cancelled after {progress_tracker.completed} of {progress_tracker.total_pages} pages")
+        else:
+            failed = summary['error'] + summary['skipped']
+            status_label.config(text=f"Done: {summary['saved']} saved, {summary['no_match']} without a match "
+                                     f"in {format_duration(time.perf_counter() - progress_tracker.started)}"
+                                     + (f", {failed} failed (see run_report.txt)" if failed else ""))
+        convert_button.config(state='normal')
+        cancel_button.config(state='disabled')
+    root.after(100, poll_progress)
+
+def cancel_conversion():
+    # Stops queuing pages; the pages already running finish and the pool
+    # shuts down normally, so a later run resumes from the checkpoint.
+    if cancel_event is not None:
+        cancel_event.set()
+        cancel_button.config(state='disabled')
+        status_label.config(text="Cancelling, waiting for pages in progress...")
+
 def exit_program():
+    if cancel_event is not None:
+        cancel_event.set()
     root.destroy()
 
-root = Tk()
-root.title("PDF Processor with Progress Bar")
-root.geometry("400x250")
+if __name__ == '__main__':
+    freeze_support()
+
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
+    progress_queue = queue.Queue()
+    progress_tracker = None
+    cancel_event = None
+
+    root = Tk()
+    root.title("PDF Processor with Progress Bar")
+    root.geometry("400x340")
+
+    title_label = Label(root, text="PDF Processor", font=("Helvetica", 16))
+    title_label.pack(pady=10)
+
+    convert_button = Button(root, text="Convert PDF", command=start_convert_pdf, width=20)
+    convert_button.pack(pady=10)
 
-title_label = Label(root, text="PDF Processor", font=("Helvetica", 16))
-title_label.pack(pady=10)
+    cancel_button = Button(root, text="Cancel", command=cancel_conversion, width=20, state='disabled')
+    cancel_button.pack(pady=5)
 
-convert_button = Button(root, text="Convert PDF", command=start_convert_pdf, width=20)
-convert_button.pack(pady=10)
+    exit_button = Button(root, text="Exit", command=exit_program, width=20)
+    exit_button.pack(pady=10)
 
-exit_button = Button(root, text="Exit", command=exit_program, width=20)
-exit_button.pack(pady=10)
+    progress_var = IntVar()
+    progress_bar = ttk.Progressbar(root, variable=progress_var, maximum=100)
+    progress_bar.pack(pady=(20, 5), padx=20, fill='x')
 
-progress_var = IntVar()
-progress_bar = ttk.Progressbar(root, variable=progress_var, maximum=100)
-progress_bar.pack(pady=20, padx=20, fill='x')
+    status_label = Label(root, text="")
+    status_label.pack()
+    counts_label = Label(root, text="")
+    counts_label.pack()
 
-root.mainloop()
\ No newline at end of file
+    root.after(100, poll_progress)
+    root.mainloop()
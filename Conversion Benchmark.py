@@ -0,0 +1,319 @@
+# Conversion Benchmark
+# Generates synthetic POD PDFs, times each stage of the conversion pipeline
+# and the end-to-end throughput for several worker counts, and writes the
+# results as JSON so runs of different versions can be diffed.
+#
+# Usage:
+#   python "Conversion Benchmark.py" --sizes 10 100 --workers 1 4 --output bench_0.0.9.json
+
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import importlib.util
+from multiprocessing import cpu_count, freeze_support
+
+CONVERSION_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Conversion 0.0.9.py")
+
+def load_conversion_module(script_path=CONVERSION_SCRIPT):
+    # The script name has spaces, so it is loaded by path. It is registered in
+    # sys.modules so pool workers can unpickle process_page by module name;
+    # this runs at import time because spawned workers re-import this file.
+    spec = importlib.util.spec_from_file_location("conversion", script_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["conversion"] = module
+    spec.loader.exec_module(module)
+    return module
+
+conversion = load_conversion_module()
+fitz = conversion.fitz
+pytesseract = conversion.pytesseract
+from PIL import Image, ImageDraw, ImageFont
+
+PAGE_WIDTH_PT, PAGE_HEIGHT_PT = 612, 792
+SCAN_DPI = 200
+NUMBER_PATTERN = r'\d{10}'
+
+def load_font(size):
+    for font_name in ("arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf"):
+        try:
+            return ImageFont.truetype(font_name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+def pod_number(rng):
+    return str(rng.randrange(10 ** 9, 10 ** 10))
+
+def draw_scanned_page(number, rng):
+    # A grey page with a header, the PRO number in the top right and some
+    # body lines, then sensor noise and a slight skew like a real scan.
+    width, height = int(8.5 * SCAN_DPI), int(11 * SCAN_DPI)
+    image = Image.new('L', (width, height), 245)
+    draw = ImageDraw.Draw(image)
+    header_font, body_font = load_font(48), load_font(30)
+    draw.text((120, 120), "DELIVERY RECEIPT", fill=20, font=header_font)
+    draw.text((int(width * 0.55), 130), f"PRO {number}", fill=20, font=header_font)
+    for line in range(18):
+        words = " ".join(rng.choice(("SHIPPER", "CONSIGNEE", "PIECES", "WEIGHT", "SIGNED", "DATE", "FREIGHT"))
+                         for _ in range(6))
+        draw.text((120, 400 + line * 80), words, fill=40, font=body_font)
+    noise = Image.effect_noise((width, height), 25)
+    image = Image.blend(image, noise, 0.12)
+    return image.rotate(rng.uniform(-1.0, 1.0), fillcolor=245)
+
+def add_digital_page(document, number, rng):
+    page = document.new_page(width=PAGE_WIDTH_PT, height=PAGE_HEIGHT_PT)
+    page.insert_text((72, 72), "DELIVERY RECEIPT", fontsize=18)
+    page.insert_text((340, 72), f"PRO {number}", fontsize=14)
+    for line in range(18):
+        page.insert_text((72, 140 + line * 30), f"Line item {line + 1}: {rng.randrange(1, 500)} pieces", fontsize=11)
+
+def add_scanned_page(document, number, rng):
+    page = document.new_page(width=PAGE_WIDTH_PT, height=PAGE_HEIGHT_PT)
+    buffer = io.BytesIO()
+    draw_scanned_page(number, rng).save(buffer, format='JPEG', quality=75)
+    page.insert_image(page.rect, stream=buffer.getvalue())
+
+def generate_pdf(pdf_path, kind, pages, seed=0):
+    # Returns {page_number: expected number} for the generated document.
+    rng = random.Random(f"{kind}-{pages}-{seed}")
+    document = fitz.open()
+    expected = {}
+    for page_number in range(pages):
+        number = pod_number(rng)
+        page_kind = kind if kind != 'mixed' else rng.choice(('digital', 'scanned'))
+        if page_kind == 'digital':
+            add_digital_page(document, number, rng)
+        else:
+            add_scanned_page(document, number, rng)
+        expected[page_number] = number
+    document.save(pdf_path, garbage=3, deflate=True)
+    document.close()
+    return expected
+
+def tesseract_version():
+    try:
+        return str(pytesseract.get_tesseract_version())
+    except Exception:
+        return None
+
+def summarize_timings(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        'samples': len(ordered),
+        'mean_ms': round(1000 * statistics.fmean(ordered), 3),
+        'p50_ms': round(1000 * ordered[len(ordered) // 2], 3),
+        'p95_ms': round(1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+def time_call(timings, stage, function, *args, **kwargs):
+    started = time.perf_counter()
+    value = function(*args, **kwargs)
+    timings.setdefault(stage, []).append(time.perf_counter() - started)
+    return value
+
+def available_ocr_engines(has_tesseract_binary):
+    engines = []
+    if has_tesseract_binary:
+        engines.append('pytesseract')
+    if conversion.tesserocr is not None:
+        engines.append('tesserocr')
+    return engines
+
+def benchmark_stages(pdf_path, sample_pages, dpi, crop_ratio, options, ocr_engines, scratch_folder):
+    timings = {}
+    engines = {name: conversion.OcrEngine(name, options['tessdata_path']) for name in ocr_engines}
+    for _ in range(sample_pages):
+        document = time_call(timings, 'open', fitz.open, pdf_path)
+        document.close()
+
+    session = conversion.DocumentSession(pdf_path)
+    try:
+        for page_number in range(min(sample_pages, len(session))):
+            with session.page(page_number) as page:
+                time_call(timings, 'text', page.get_text)
+            image = time_call(timings, 'render', conversion.render_page, session, page_number, dpi=dpi,
+                              colorspace=options['render_colorspace'], backend=options['render_backend'])
+            for engine_name, engine in engines.items():
+                time_call(timings, f"ocr_{engine_name}", engine.image_to_string, image, lang=options['ocr_lang'])
+            # The pipeline renders saved pages clipped to the crop; the raster
+            # crop of the full render is kept for comparison.
+            time_call(timings, 'crop', conversion.crop_image, image, crop_ratio=crop_ratio)
+            cropped = time_call(timings, 'render_cropped', conversion.render_page, session, page_number, dpi=dpi,
+                                colorspace=options['render_colorspace'], backend=options['render_backend'],
+                                crop_ratio=crop_ratio)
+            buffer = io.BytesIO()
+            time_call(timings, 'encode', cropped.save, buffer, **conversion.output_save_args(options))
+            output_path = os.path.join(scratch_folder, f"stage_{page_number}.bin")
+            with open(output_path, 'wb') as output_file:
+                time_call(timings, 'write', output_file.write, buffer.getvalue())
+    finally:
+        session.close()
+        for engine in engines.values():
+            engine.close()
+    return {stage: summarize_timings(samples) for stage, samples in timings.items()}
+
+def ocr_calls_per_second(stages):
+    # Full-page OCR throughput of one worker for each engine, so pooled
+    # (tesserocr) and per-call (pytesseract) OCR can be compared directly.
+    return {
+        stage[len('ocr_'):]: round(1000 / stats['mean_ms'], 3)
+        for stage, stats in stages.items() if stage.startswith('ocr_') and stats and stats['mean_ms']
+    }
+
+OCR_MODES = (
+    ('full', False, ()),
+    ('number_hunt', True, ()),
+    ('number_hunt_preprocessed', True, conversion.PREPROCESS_STEPS),
+)
+
+def benchmark_ocr_modes(pdf_path, expected, sample_pages, options):
+    # Accuracy against the generated numbers and time per page for the
+    # number-hunt pass with escalation versus full English OCR only, and for
+    # the number hunt on preprocessed (cleaned and deskewed) images.
+    modes = {}
+    session = conversion.DocumentSession(pdf_path)
+    try:
+        for mode, number_hunt, preprocess_steps in OCR_MODES:
+            if preprocess_steps and conversion.np is None:
+                continue
+            mode_options = dict(options, number_hunt=number_hunt, preprocess_steps=preprocess_steps)
+            durations = []
+            preprocess_durations = []
+            correct = 0
+            escalated = 0
+            for page_number in range(min(sample_pages, len(session))):
+                timer = conversion.PageTimer()
+                started = time.perf_counter()
+                ocr = conversion.ocr_page(session, page_number, NUMBER_PATTERN, mode_options, timer)
+                durations.append(time.perf_counter() - started)
+                if preprocess_steps:
+                    preprocess_durations.append(timer.timings.get('preprocess', 0.0))
+                correct += ocr['number'] == expected[page_number]
+                escalated += number_hunt and ocr['ocr_pass'] == 'full'
+            modes[mode] = {
+                'accuracy': round(correct / len(durations), 3) if durations else None,
+                'escalated': escalated,
+                'timing': summarize_timings(durations),
+            }
+            if preprocess_steps:
+                modes[mode]['preprocess_timing'] = summarize_timings(preprocess_durations)
+    finally:
+        session.close()
+    return modes
+
+def benchmark_end_to_end(pdf_path, pages, workers, crop_ratio, options, scratch_folder):
+    output_folder = tempfile.mkdtemp(prefix='e2e_', dir=scratch_folder)
+    started = time.perf_counter()
+    summary = conversion.process_pdfs([pdf_path], output_folder, NUMBER_PATTERN, crop_ratio, options=options,
+                                      workers=workers, execution_mode='sequential' if workers == 1 else 'process')
+    elapsed = time.perf_counter() - started
+    shutil.rmtree(output_folder, ignore_errors=True)
+    return {
+        'workers': workers,
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(pages / elapsed, 3) if elapsed else None,
+        'saved': summary['saved'],
+        'no_match': summary['no_match'],
+        'error': summary['error'],
+        'ocr_pages': summary['ocr_pages'],
+    }
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the PDF conversion pipeline on synthetic POD PDFs.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="Pages per generated PDF")
+    parser.add_argument('--kinds', nargs='+', choices=['digital', 'scanned', 'mixed'],
+                        default=['digital', 'scanned', 'mixed'])
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, cpu_count()}))
+    parser.add_argument('--dpi', type=int, default=conversion.DEFAULT_OPTIONS['output_dpi'])
+    parser.add_argument('--crop-ratio', type=float, default=0.95)
+    parser.add_argument('--format', choices=list(conversion.OUTPUT_FORMATS), default='png')
+    parser.add_argument('--stage-sample', type=int, default=10, help="Pages per document used for stage timings")
+    parser.add_argument('--tesseract-cmd', default=None, help="Path to tesseract if not the Windows default")
+    parser.add_argument('--work-dir', default=None, help="Where to generate PDFs (default: a temporary folder)")
+    parser.add_argument('--keep-files', action='store_true')
+    parser.add_argument('--output', default='bench_results.json')
+    return parser
+
+def main(argv):
+    args = build_arg_parser().parse_args(argv)
+    if args.tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+    ocr_version = tesseract_version()
+    ocr_engines = available_ocr_engines(ocr_version is not None)
+    has_ocr = bool(ocr_engines)
+    if not has_ocr:
+        print("Tesseract not found: OCR stage timings and OCR-dependent end-to-end runs are skipped.")
+
+    options = conversion.resolve_options({
+        'output_dpi': args.dpi,
+        'output_format': args.format,
+        'ocr_cache_path': None,
+        'resume': False,
+    })
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='conversion_bench_')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {
+        'script': os.path.basename(CONVERSION_SCRIPT),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': cpu_count(),
+        'pymupdf': fitz.VersionBind,
+        'tesseract': ocr_version,
+        'ocr_engines': ocr_engines,
+        'settings': {'dpi': args.dpi, 'crop_ratio': args.crop_ratio, 'format': args.format},
+        'documents': [],
+    }
+    try:
+        for kind in args.kinds:
+            for pages in args.sizes:
+                pdf_path = os.path.join(work_dir, f"synthetic_{kind}_{pages}.pdf")
+                started = time.perf_counter()
+                expected = generate_pdf(pdf_path, kind, pages)
+                print(f"Generated {pdf_path} in {time.perf_counter() - started:.1f}s")
+
+                stages = benchmark_stages(pdf_path, args.stage_sample, args.dpi, args.crop_ratio, options,
+                                          ocr_engines, work_dir)
+                document_results = {
+                    'kind': kind,
+                    'pages': pages,
+                    'bytes': os.path.getsize(pdf_path),
+                    'stages': stages,
+                    'ocr_calls_per_second': ocr_calls_per_second(stages),
+                    'end_to_end': [],
+                }
+                if has_ocr and kind != 'digital':
+                    document_results['ocr_modes'] = benchmark_ocr_modes(pdf_path, expected, args.stage_sample, options)
+                if kind != 'digital' and not has_ocr:
+                    document_results['end_to_end_skipped'] = 'tesseract not available'
+                else:
+                    for workers in args.workers:
+                        run = benchmark_end_to_end(pdf_path, pages, workers, args.crop_ratio, options, work_dir)
+                        document_results['end_to_end'].append(run)
+                        print(f"{kind:8} {pages:5} pages, {workers:2} workers: {run['pages_per_second']} pages/s")
+                results['documents'].append(document_results)
+    finally:
+        if not args.keep_files and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    freeze_support()
+    sys.exit(main(sys.argv[1:]))